@@ -3,11 +3,14 @@ import numpy as np
 from mdp.environment.env import Environment
 from mdp.algorithms.value_iteration import ValueIteration
 from mdp.algorithms.policy_iteration import PolicyIteration
+from mdp.algorithms.rtdp import RTDP
 from mdp.algorithms.monte_carlo import MonteCarlo
 from mdp.algorithms.sarsa import SARSA
 from mdp.algorithms.expected_sarsa import ExpectedSarsa
 from mdp.algorithms.q_learning import QLearning
 from mdp.algorithms.dyna_q import DynaQ
+from mdp.algorithms.hyperparameter_sweep import HyperparameterSweep
+from mdp.utils.seed_runner import SeedRunner
 
 from display_manager import DisplayManager
 
@@ -34,6 +37,11 @@ def parse_args():
     parser.add_argument(
         "--display_utilities", help="Display image of utilities", default=False,
         required=False)
+    parser.add_argument(
+        "--vectorized", help="Use the vectorized NumPy backend for value iteration", action='store_true')
+    parser.add_argument(
+        "--num_seeds", help="Run a learning algorithm with this many seeds in parallel and print aggregated statistics", default=1,
+        required=False)
     return parser.parse_args()
 
 
@@ -43,9 +51,39 @@ if __name__ == '__main__':
     mdp = Environment(grid, actions, rewards, gw, gh)
     algorithm = args.algorithm
 
-    if algorithm == 'value_iteration':
+    # Learning algorithms and their parameters, used to run many seeds
+    learners = {
+        'sarsa': (SARSA, dict(gamma=sarsa_gamma, epsilon=sarsa_epsilon, num_episodes=sarsa_num_episodes, num_steps=sarsa_num_steps,
+                              step_size=sarsa_step_size)),
+        'expected_sarsa': (ExpectedSarsa, dict(gamma=expected_sarsa_gamma, epsilon=expected_sarsa_epsilon, num_episodes=expected_sarsa_num_episodes,
+                                               num_steps=expected_sarsa_num_steps, step_size=expected_sarsa_step_size)),
+        'q_learning': (QLearning, dict(gamma=q_learning_gamma, epsilon=q_learning_epsilon, num_episodes=q_learning_num_episodes,
+                                       num_steps=q_learning_num_steps, step_size=q_learning_step_size)),
+        'monte_carlo': (MonteCarlo, dict(gamma=monte_carlo_gamma, epsilon=monte_carlo_epsilon, num_episodes=monte_carlo_num_episodes,
+                                         num_steps=monte_carlo_num_steps)),
+        'dyna_q': (DynaQ, dict(gamma=dyna_q_gamma, epsilon=dyna_q_epsilon, num_episodes=dyna_q_num_episodes, num_steps=dyna_q_num_steps,
+                               step_size=dyna_q_step_size, planning_steps=dyna_q_planning_steps)),
+    }
+
+    if int(args.num_seeds) > 1 and algorithm in learners:
+        learner, parameters = learners[algorithm]
+        parameters = dict(parameters, n_w=mdp.grid_width, n_h=mdp.grid_height, n_actions=mdp.num_actions)
+
+        # Value iteration solution the greedy policies are compared with
+        reference = ValueIteration(gamma=parameters['gamma'], vectorized=True).solve(mdp, epsilon=vi_epsilon)
+
+        runner = SeedRunner(learner, parameters, num_seeds=int(args.num_seeds), seed=seed_runner_seed)
+        results = runner.run(mdp, reference)
+
+        print(f"\nPolicy agreement with value iteration: {results['agreement_mean']:.3f} +/- {results['agreement_ci']:.3f}")
+        print('\n(Column, Row)')
+        for i in range(mdp.grid_height):
+            for j in range(mdp.grid_width):
+                print(f"{j, i}: {results['values_mean'][i][j]:.3f} +/- {results['values_ci'][i][j]:.3f}")
+
+    elif algorithm == 'value_iteration':
 
-        value_iteration = ValueIteration(gamma=vi_gamma)
+        value_iteration = ValueIteration(gamma=vi_gamma, vectorized=args.vectorized, method=vi_method, sweep_order=vi_sweep_order)
         results = value_iteration.solve(mdp, epsilon=vi_epsilon)
 
         num_iterations = results['iterations']
@@ -59,7 +97,7 @@ if __name__ == '__main__':
                 print(f"{j, i}: {values[i][j]}")
 
         if args.display_policy:
-            directions = [[CONVERT_POLICY_TUPLE[cell] for cell in row] for row in policy]
+            directions = [[CONVERT_POLICY_TUPLE[mdp.actions[cell]] for cell in row] for row in policy]
             
             display_manager = DisplayManager(block_size=block_size, width=width, height=height)
 
@@ -74,7 +112,7 @@ if __name__ == '__main__':
 
 
     elif algorithm == 'policy_iteration':
-        policy_iteration = PolicyIteration(gamma=pi_gamma, k=pi_k)
+        policy_iteration = PolicyIteration(gamma=pi_gamma, k=pi_k, evaluation=pi_evaluation)
         results = policy_iteration.solve(mdp)
 
         num_iterations = results['iterations']
@@ -88,7 +126,7 @@ if __name__ == '__main__':
                 print(f"{j, i}: {values[i][j]}")
 
         if args.display_policy:
-            directions = [[CONVERT_POLICY_TUPLE[cell] for cell in row] for row in policy]
+            directions = [[CONVERT_POLICY_TUPLE[mdp.actions[cell]] for cell in row] for row in policy]
             
             display_manager = DisplayManager(block_size=block_size, width=width, height=height)
 
@@ -101,6 +139,38 @@ if __name__ == '__main__':
 
             display_manager.display(array=utilities, grid=grid, offset=UTILITY_OFFSET, font=UTILITY_FONT, title='Policy Iteration')
 
+    elif algorithm == 'rtdp':
+        rtdp = RTDP(gamma=rtdp_gamma, max_depth=rtdp_max_depth)
+        results = rtdp.solve(mdp, start_states=rtdp_start_states, epsilon=rtdp_epsilon)
+
+        num_iterations = results['iterations']
+        values = results['utilities']
+        policy = results['policy']
+        visited = results['visited']
+
+        print(f'Number of trials: {num_iterations}\n')
+        print(f'Converged: {results["converged"]}\n')
+        print(f'Number of visited states: {visited.sum()}\n')
+        print('\n(Column, Row)')
+        for i in range(values.shape[0]):
+            for j in range(values.shape[1]):
+                if visited[i][j]:
+                    print(f"{j, i}: {values[i][j]}")
+
+        if args.display_policy:
+            directions = [[CONVERT_POLICY_TUPLE[mdp.actions[cell]] if visited[i][j] else '' for j, cell in enumerate(row)] for i, row in enumerate(policy)]
+            
+            display_manager = DisplayManager(block_size=block_size, width=width, height=height)
+
+            display_manager.display(array=directions, grid=grid, offset=POLICY_OFFSET, font=POLICY_FONT, title='RTDP')
+
+        if args.display_utilities:
+            utilities = [["{:.3f}".format(cell) if visited[i][j] else '' for j, cell in enumerate(row)] for i, row in enumerate(values)]
+            
+            display_manager = DisplayManager(block_size=block_size, width=width, height=height)
+
+            display_manager.display(array=utilities, grid=grid, offset=UTILITY_OFFSET, font=UTILITY_FONT, title='RTDP')
+
     elif algorithm == 'sarsa':
         sarsa = SARSA(n_w=mdp.grid_width, n_h=mdp.grid_height, n_actions=mdp.num_actions, gamma=sarsa_gamma, epsilon=sarsa_epsilon,
                 num_episodes=sarsa_num_episodes, num_steps=sarsa_num_steps, step_size=sarsa_step_size)
@@ -153,7 +223,8 @@ if __name__ == '__main__':
 
     elif algorithm == 'q_learning':
         q_learning = QLearning(n_w=mdp.grid_width, n_h=mdp.grid_height, n_actions=mdp.num_actions, gamma=q_learning_gamma, epsilon=q_learning_epsilon,
-        num_episodes=q_learning_num_episodes, num_steps=q_learning_num_steps, step_size=q_learning_step_size)
+        num_episodes=q_learning_num_episodes, num_steps=q_learning_num_steps, step_size=q_learning_step_size,
+        num_workers=q_learning_num_workers, tolerance=q_learning_tolerance)
 
         q_table = q_learning.solve(mdp=mdp)
 
@@ -226,7 +297,24 @@ if __name__ == '__main__':
 
             display_manager.display(array=utilities, grid=grid, offset=UTILITY_OFFSET, font=UTILITY_FONT, title='Dyna Q')
 
+    elif algorithm == 'hyperparameter_sweep':
+        step_sizes, epsilons, gammas = np.meshgrid(sweep_step_sizes, sweep_epsilons, sweep_gammas, indexing='ij')
+
+        sweep = HyperparameterSweep(n_w=mdp.grid_width, n_h=mdp.grid_height, n_actions=mdp.num_actions, step_sizes=step_sizes.ravel(),
+        epsilons=epsilons.ravel(), gammas=gammas.ravel(), target=sweep_target, num_episodes=sweep_num_episodes, num_steps=sweep_num_steps,
+        planning_steps=sweep_planning_steps)
+
+        results = sweep.solve(mdp=mdp)
+
+        # Average return over the last tenth of the episodes
+        window = max(1, sweep_num_episodes // 10)
+        final_returns = results['returns'][:, -window:].mean(axis=1)
+
+        print('\nStep Size, Epsilon, Gamma: Final Return')
+        for k in np.argsort(-final_returns):
+            print(f"{sweep.step_sizes[k]}, {sweep.epsilons[k]}, {sweep.gammas[k]}: {final_returns[k]:.3f}")
+
     else:
         print("Invalid Choice")
         print("The following options for algorithm are:")
-        print("value_iteration\npolicy_iteration\nsarsa\nexpected_sarsa\nq_learning\nmonte_carlo\ndyna_q")
\ No newline at end of file
+        print("value_iteration\npolicy_iteration\nrtdp\nsarsa\nexpected_sarsa\nq_learning\nmonte_carlo\ndyna_q\nhyperparameter_sweep")
\ No newline at end of file
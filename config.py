@@ -19,11 +19,20 @@ vi_gamma = 0.99
 vi_c = 0.1
 MAX_REWARD = 1
 vi_epsilon = vi_c * MAX_REWARD
+vi_method = 'jacobi'
+vi_sweep_order = 'row_major'
 
 
 # Policy Iteration
 pi_gamma = 0.99
 pi_k = 100
+pi_evaluation = 'iterative'
+
+# RTDP
+rtdp_gamma = 0.99
+rtdp_epsilon = vi_c * MAX_REWARD
+rtdp_max_depth = 100
+rtdp_start_states = [(5, 0)]
 
 # Q Learning
 q_learning_gamma = 0.99
@@ -31,6 +40,8 @@ q_learning_step_size = 0.1
 q_learning_num_episodes = 50000
 q_learning_num_steps = 100
 q_learning_epsilon = 0.25
+q_learning_num_workers = 1
+q_learning_tolerance = None
 
 # Expected SARSA
 expected_sarsa_gamma = 0.99
@@ -59,4 +70,20 @@ dyna_q_step_size = 0.1
 dyna_q_num_episodes = 50000
 dyna_q_num_steps = 100
 dyna_q_epsilon = 0.25
-dyna_q_planning_steps = 100
\ No newline at end of file
+dyna_q_planning_steps = 100
+
+# Hyperparameter Sweep
+# Every combination of the values below is trained together, set sweep_planning_steps above 0 to sweep Dyna-Q
+
+sweep_target = 'max'
+sweep_step_sizes = [0.05, 0.1, 0.2]
+sweep_epsilons = [0.1, 0.25]
+sweep_gammas = [0.99]
+sweep_num_episodes = 50000
+sweep_num_steps = 100
+sweep_planning_steps = 0
+
+# Seed Runner
+# Root seed of the runs started with --num_seeds, None draws fresh entropy
+
+seed_runner_seed = None
\ No newline at end of file
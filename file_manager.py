@@ -1,3 +1,4 @@
+import numpy as np
 import pandas as pd
 
 
@@ -14,6 +15,7 @@ class FileManager():
     Methods
     ----------
     write(filename, data) : Writes the data to the file
+    read_history(filename) : Opens a recorded utility history lazily
     """
 
     def __init__(self, path):
@@ -43,5 +45,23 @@ class FileManager():
         filepath = self.path + filename
         dataframe = pd.DataFrame.from_dict(data) 
         dataframe.to_csv(filepath, index=None)
-        
-        
\ No newline at end of file
+
+
+    def read_history(self, filename):
+        """
+        Opens a utility history written by MemmapRecorder as a read-only memory map,
+        without loading it into memory
+
+        Parameters
+        ----------
+
+        filename : str
+            Name of the .npy file to open
+
+        Returns
+        ----------
+        array of shape (sweeps, grid_height, grid_width)
+        """
+
+        filepath = self.path + filename
+        return np.load(filepath, mmap_mode='r')
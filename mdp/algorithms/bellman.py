@@ -0,0 +1,145 @@
+"""
+Matrix-free Bellman backups on the utility grid
+
+The utility of the cell reached by moving in a direction is found by shifting the whole
+utility grid by that direction. Cells where the move would leave the grid or walk into a
+wall keep their own utility. The action values are then a weighted sum of the shifted grids.
+"""
+
+
+import math
+
+import numpy as np
+
+
+# Units in the last place of the largest utility below which utility changes are rounding noise
+RESOLUTION_ULPS = 8
+
+
+def shift_utilities(utilities, mdp):
+    """
+    Returns the utility of the cell reached by moving in each action direction
+
+    Parameters
+    ----------
+    utilities : N-D Array
+        Utilities with the grid in the last two axes, shape (..., grid_height, grid_width)
+
+    mdp : Environment object
+        MDP providing the move mask
+
+    Returns
+    ----------
+    shifted utilities of shape (num_actions, ..., grid_height, grid_width)
+    """
+
+    shifted = np.empty((mdp.num_actions,) + utilities.shape, dtype=utilities.dtype)
+
+    for idx, direction in enumerate(mdp.actions):
+
+        # rolled[..., r, c] = utilities[..., r + dr, c + dc], wrapped cells are masked out below
+        rolled = np.roll(utilities, shift=(-direction[0], -direction[1]), axis=(-2, -1))
+        shifted[idx] = np.where(mdp.move_mask[idx], rolled, utilities)
+
+    return shifted
+
+
+def action_values(utilities, mdp):
+    """
+    Returns the expected utility of taking each action in every cell
+
+    Parameters
+    ----------
+    utilities : N-D Array
+        Utilities with the grid in the last two axes, shape (..., grid_height, grid_width)
+
+    mdp : Environment object
+        MDP providing the move mask and slip weights
+
+    Returns
+    ----------
+    action values of shape (num_actions, ..., grid_height, grid_width)
+    """
+
+    shifted = shift_utilities(utilities, mdp)
+
+    # Combine the intended and perpendicular moves with the slip weights
+    return np.tensordot(mdp.slip_weights.astype(utilities.dtype), shifted, axes=1)
+
+
+def utility_resolution(max_reward, gamma, dtype):
+    """
+    Returns the smallest utility change a backup in the given precision can reliably show.
+    Rounding makes the utility change of a backup jitter by a few units in the last place
+    of the largest utility, max |R| / (1 - gamma), so a convergence threshold below it may never be met
+
+    Parameters
+    ----------
+    max_reward : double or N-D Array
+        Largest reward magnitude of the MDP
+
+    gamma : double or N-D Array
+        Discount factor
+
+    dtype : data-type
+        Floating point type of the utilities
+
+    Returns
+    ----------
+    smallest meaningful utility change, broadcast over max_reward and gamma
+    """
+
+    # Bound on the magnitude of any utility
+    max_utility = np.asarray(max_reward, dtype=np.float64) / (1 - np.asarray(gamma, dtype=np.float64))
+
+    return RESOLUTION_ULPS * np.finfo(dtype).eps * max_utility
+
+
+def model_lists(mdp):
+    """
+    Returns the rewards and compiled transitions of the mdp as Python lists.
+    Single-state backups are cheaper on Python lists than on small NumPy slices
+
+    Parameters
+    ----------
+    mdp : Environment object
+        MDP providing the rewards and compiled transitions
+
+    Returns
+    ----------
+    rewards, transition states and transition probabilities as nested lists
+    """
+
+    return mdp.reward_array.tolist(), mdp.transition_states.tolist(), mdp.transition_probabilities.tolist()
+
+
+def greedy_action(state_idx, values, transition_states, transition_probabilities):
+    """
+    Returns the greedy action of a single state and its expected utility
+
+    Parameters
+    ----------
+    state_idx : int
+        Flat index of the state
+    values : List
+        Flat utilities
+    transition_states : List
+        Nested list of the compiled transition states from model_lists
+    transition_probabilities : List
+        Nested list of the compiled transition probabilities from model_lists
+
+    Returns
+    ----------
+    index of the greedy action, expected utility of the greedy action
+    """
+
+    best_action = 0
+    best_action_value = -math.inf
+
+    for action_idx, (next_states, probabilities) in enumerate(zip(transition_states[state_idx], transition_probabilities[state_idx])):
+        action_value = probabilities[0] * values[next_states[0]] + probabilities[1] * values[next_states[1]] + probabilities[2] * values[next_states[2]]
+        if action_value > best_action_value:
+            best_action = action_idx
+            best_action_value = action_value
+
+    return best_action, best_action_value
@@ -0,0 +1,75 @@
+"""
+Worker side of the asynchronous (Hogwild) TD learning
+
+The Q-table lives in shared memory and every worker process updates it in place without locks,
+acting in its own copy of the Environment. A second shared array holds the stop flag set by
+the main process followed by the number of episodes each worker has finished.
+"""
+
+
+from multiprocessing import shared_memory
+
+import numpy as np
+
+from mdp.utils.random_stream import RandomStream
+
+
+def attach_shared_array(spec):
+    """
+    Attaches to a shared array created by create_shared_array
+
+    Parameters
+    ----------
+    spec : Tuple
+        (shared memory name, shape, dtype) of the array
+
+    Returns
+    ----------
+    shared memory block, array view of the block
+    """
+
+    name, shape, dtype = spec
+    block = shared_memory.SharedMemory(name=name)
+
+    return block, np.ndarray(shape, dtype=dtype, buffer=block.buf)
+
+
+def run_worker(learner, mdp, q_spec, control_spec, worker_idx, num_episodes, seed):
+    """
+    Runs episodes of the learner on the shared Q-table until its share of the budget
+    is used up or the main process sets the stop flag
+
+    Parameters
+    ----------
+    learner : TemporalDifference object
+        Copy of the learner owned by the worker
+    mdp : Environment object
+        Copy of the Environment owned by the worker
+    q_spec : Tuple
+        (shared memory name, shape, dtype) of the Q-table
+    control_spec : Tuple
+        (shared memory name, shape, dtype) of the stop flag and episode counters
+    worker_idx : int
+        Index of the worker
+    num_episodes : int
+        Number of episodes of the worker
+    seed : int
+        Seed of the worker's random stream
+    """
+
+    q_block, q_values = attach_shared_array(q_spec)
+    control_block, control = attach_shared_array(control_spec)
+
+    try:
+        # Act on the shared Q-table with a random stream of its own
+        learner.q_values = q_values
+        learner.q_table = q_values.reshape(learner.n_h, learner.n_w, learner.n_actions)
+        learner.random_stream = RandomStream(seed)
+
+        learner.run_episodes(mdp, num_episodes, control, worker_idx)
+
+    finally:
+        # Drop the views before closing the blocks
+        del learner.q_values, learner.q_table, q_values, control
+        q_block.close()
+        control_block.close()
@@ -1,11 +1,12 @@
 import numpy as np
-import random
+
+from mdp.utils.random_stream import RandomStream
 
 
 class MonteCarlo():
 
-    def __init__(self, n_w, n_h, n_actions, gamma=0.99, num_episodes=100000, num_steps=1000, epsilon=0.1) -> None:
-        self.q_table = np.zeros((n_h, n_w, n_actions))
+    def __init__(self, n_w, n_h, n_actions, gamma=0.99, num_episodes=100000, num_steps=1000, epsilon=0.1, dtype=np.float64, seed=None, stopping=None) -> None:
+        self.q_table = np.zeros((n_h, n_w, n_actions), dtype=dtype)
         self.n_h = n_h
         self.n_w = n_w
         self.n_actions = n_actions
@@ -13,12 +14,24 @@ class MonteCarlo():
         self.num_episodes = num_episodes
         self.num_steps = num_steps
         self.epsilon = epsilon
+        self.random_stream = RandomStream(seed)
+        self.stopping = stopping
+        self.stop_reason = None
+        self.episodes = 0
 
     def solve(self, mdp):
 
         # Solve and return Q_table
         returns_count = {}
 
+        # Flat view of the Q-table for the stopping criteria
+        q_values = self.q_table.reshape(-1, self.n_actions)
+        self.stop_reason = 'budget'
+        self.episodes = 0
+
+        if self.stopping is not None:
+            self.stopping.reset(q_values, mdp.walls)
+
         for episode in range(self.num_episodes):
 
             states = []
@@ -33,13 +46,13 @@ class MonteCarlo():
 
             for step in range(self.num_steps):
 
-                rand_num = random.uniform(0, 1)
+                rand_num = self.random_stream.random()
                 if rand_num <= self.epsilon:
-                    action = random.randint(0, self.n_actions-1)
+                    action = self.random_stream.integers(self.n_actions)
                 else:
                     action = np.argmax(self.q_table[state[0]][state[1]])
 
-                next_state, reward = mdp.step(state, mdp.action_map(action))
+                next_state, reward = mdp.step(state, mdp.action_map(action), self.random_stream.random())
 
                 states.append(state)
                 actions.append(action)
@@ -72,13 +85,25 @@ class MonteCarlo():
                     self.q_table[state[0]][state[1]][action] = G
                     returns_count[(state, action)] = 1
 
-        return self.q_table
+            self.episodes += 1
+
+            if self.stopping is not None and self.episodes % self.stopping.check_interval == 0:
+                reason = self.stopping.check(q_values)
+
+                if reason is not None:
+                    self.stop_reason = reason
+                    break
+
+        if self.stopping is None:
+            return self.q_table
+
+        return {"q_table": self.q_table, "stop_reason": self.stop_reason, "episodes": self.episodes}
 
     def get_starting_state(self, mdp, n_h, n_w):
 
-        state = (random.randint(0, n_h-1), random.randint(0, n_w-1))
+        state = (self.random_stream.integers(n_h), self.random_stream.integers(n_w))
 
         while mdp.is_wall(state):
-            state = (random.randint(0, n_h-1), random.randint(0, n_w-1))
+            state = (self.random_stream.integers(n_h), self.random_stream.integers(n_w))
         
         return state
\ No newline at end of file
@@ -0,0 +1,112 @@
+"""
+Worker side of the process-parallel value iteration
+
+The utility grid (double buffered), rewards, walls and move mask live in shared memory.
+Every worker attaches to them once when the pool starts, then backs up one horizontal band
+of rows per task. The rows just above and below the band are read as halo rows from the
+shared utilities of the previous sweep.
+"""
+
+
+from multiprocessing import shared_memory
+from types import SimpleNamespace
+
+import numpy as np
+
+from mdp.algorithms import bellman
+
+
+# Shared arrays and settings of the worker process, set by init_worker
+worker_state = {}
+
+
+def create_shared_array(array):
+    """
+    Copies an array into a new shared memory block
+
+    Parameters
+    ----------
+    array : N-D Array
+        Array to share
+
+    Returns
+    ----------
+    shared memory block, array view of the block
+    """
+
+    block = shared_memory.SharedMemory(create=True, size=max(1, array.nbytes))
+    shared = np.ndarray(array.shape, dtype=array.dtype, buffer=block.buf)
+    shared[:] = array
+
+    return block, shared
+
+
+def init_worker(specs, actions, slip_weights, gamma):
+    """
+    Attaches the worker process to the shared arrays
+
+    Parameters
+    ----------
+    specs : dictionary
+        (shared memory name, shape, dtype) of each shared array
+    actions : List
+        All possible actions
+    slip_weights : 2-D Array
+        Probability of moving in direction d when taking action a
+    gamma : double
+        Discount factor
+    """
+
+    blocks = []
+
+    for key, (name, shape, dtype) in specs.items():
+        block = shared_memory.SharedMemory(name=name)
+        blocks.append(block)
+        worker_state[key] = np.ndarray(shape, dtype=dtype, buffer=block.buf)
+
+    # Keep the blocks referenced for the lifetime of the worker
+    worker_state['blocks'] = blocks
+    worker_state['actions'] = actions
+    worker_state['slip_weights'] = slip_weights
+    worker_state['gamma'] = gamma
+
+
+def backup_band(task):
+    """
+    Backs up rows [start, end) of the source utilities into the other buffer
+
+    Parameters
+    ----------
+    task : Tuple
+        (start, end, source) rows of the band and index of the buffer holding the previous sweep
+
+    Returns
+    ----------
+    largest utility change in the band
+    """
+
+    start, end, source = task
+
+    utilities = worker_state['utilities']
+    height = utilities.shape[1]
+
+    # Band with one halo row on each side
+    low = max(0, start - 1)
+    high = min(height, end + 1)
+
+    band = SimpleNamespace(
+        actions=worker_state['actions'],
+        num_actions=len(worker_state['actions']),
+        move_mask=worker_state['move_mask'][:, low:high],
+        slip_weights=worker_state['slip_weights'],
+    )
+
+    values = bellman.action_values(utilities[source, low:high], band).max(axis=0)
+
+    # Bellman Update of the rows inside the band, walls keep a utility of 0
+    new_utilities = worker_state['rewards'][start:end] + worker_state['gamma'] * values[start - low:end - low]
+    new_utilities[worker_state['walls'][start:end]] = 0
+
+    utilities[1 - source, start:end] = new_utilities
+
+    return float(np.abs(new_utilities - utilities[source, start:end]).max(initial=0))
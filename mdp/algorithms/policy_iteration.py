@@ -1,32 +1,51 @@
 import numpy as np
-import copy
 import math
 
+from scipy.sparse import csr_matrix, identity
+from scipy.sparse.linalg import spsolve
+
+from mdp.algorithms import bellman
+
 class PolicyIteration():
 
     """
     Policy Iteration Class
+    Policies are stored as int8 arrays of indices into mdp.actions
 
     Attributes
     ----------
     gamma : double
         Discount factor of the mdp
     k : int
-        Number of Policy Evaluation updates
-    data : dictionary
-         Data to be used for analysis
+        Number of Policy Evaluation updates, the cap on the updates in adaptive mode
+    evaluation : str
+        Policy Evaluation mode, 'iterative', 'exact' or 'adaptive'
+    eval_ratio : double
+        Ratio of the improvement gap used as the adaptive evaluation tolerance
+    tolerance : double
+        Smallest adaptive evaluation tolerance, also the residual required to stop in adaptive mode
+    improvement_gap : double
+        Largest gain in action value found by the last policy improvement step
+    evaluation_residual : double
+        Largest utility change in the last policy evaluation update
+    recorder : HistoryRecorder object
+        Records the utilities of every evaluation update for analysis, None disables recording
+    dtype : numpy dtype
+        Floating point type of the utilities
 
     Methods
     ----------
-    solve(mdp): Solves the mdp
+    solve(mdp, utilities, policy): Solves the mdp
+    resolve(mdp, previous): Re-solves the mdp after a small edit, starting from a previous solution
     policy_evaluation(policy, utilities, mdp): Policy evaluation step
+    exact_policy_evaluation(policy, mdp): Policy evaluation step by solving the linear system
     policy_improvement(policy, utilities, mdp): Policy improvement step
     get_starting_policy(mdp): Initialize the starting policy of the algorithm
     get_data(): Return statistics
     """
 
 
-    def __init__(self, gamma=0.99, k=100):
+    def __init__(self, gamma=0.99, k=100, evaluation='iterative', eval_ratio=0.1, tolerance=1e-3, recorder=None, dtype=np.float64):
         """
         Parameters
         ----------
@@ -34,15 +53,42 @@ class PolicyIteration():
             Discount Factor of the algorithm (default is 0.99)
         k : int, optional
             Number of Policy Evaluation updates (default is 100)
+        evaluation : str, optional
+            'iterative' runs k Bellman updates per evaluation, 'exact' solves (I - gamma * P_pi) V = R
+            with a sparse direct solver, 'adaptive' runs updates until the residual drops below
+            eval_ratio times the last improvement gap, with at most k updates (default is 'iterative')
+        eval_ratio : double, optional
+            Ratio of the improvement gap used as the adaptive evaluation tolerance (default is 0.1)
+        tolerance : double, optional
+            Smallest adaptive evaluation tolerance. Adaptive mode stops once the policy is stable
+            and the evaluation residual is below it (default is 1e-3)
+        recorder : HistoryRecorder object, optional
+            Records the utilities of every evaluation update for analysis (default is None, no recording)
+        dtype : data-type, optional
+            Floating point type of the utilities. With np.float32 the adaptive tolerances are raised
+            to the smallest utility change float32 can resolve (default is np.float64)
         """
 
+        if evaluation not in ('iterative', 'exact', 'adaptive'):
+            raise ValueError(f"Unknown policy evaluation mode: {evaluation}")
+
+        if not np.issubdtype(dtype, np.floating):
+            raise ValueError(f"Utilities must have a floating point dtype: {dtype}")
+
         self.gamma = gamma
         self.k = k
+        self.evaluation = evaluation
+        self.eval_ratio = eval_ratio
+        self.tolerance = tolerance
 
-        self.data = {}
+        self.improvement_gap = math.inf
+        self.evaluation_residual = math.inf
 
+        self.recorder = recorder
+        self.dtype = np.dtype(dtype)
 
-    def solve(self, mdp):
+
+    def solve(self, mdp, utilities=None, policy=None):
         """
         Solves the mdp by a series of policy evaluation and policy improvement steps
 
@@ -51,25 +97,40 @@ class PolicyIteration():
         mdp : Markov Decision Process
             an MDP with states S, actions A(s), transition model P(s | s, a)
 
+        utilities : 2D Array, optional
+            Utilities to warm start from (default is None, all zeros)
+
+        policy : 2D Array, optional
+            Policy to warm start from (default is None, the starting policy)
+
         Returns
         ----------
         utilities, policy and number of iterations
         """
 
         # Initialize the staring policy
-        policy = self.get_starting_policy(mdp)
+        if policy is None:
+            policy = self.get_starting_policy(mdp)
+        else:
+            policy = np.array(policy, dtype=np.int8).reshape(mdp.grid_height, mdp.grid_width)
 
         # Initialize the starting utilities
-        utilities = np.zeros((mdp.grid_height, mdp.grid_width), dtype=np.float)
+        if utilities is None:
+            utilities = np.zeros((mdp.grid_height, mdp.grid_width), dtype=self.dtype)
+        else:
+            utilities = np.array(utilities, dtype=self.dtype).reshape(mdp.grid_height, mdp.grid_width)
+            utilities[mdp.walls.reshape(utilities.shape)] = 0
 
         # Initialize the analysis data
-        for i in range(utilities.shape[0]):
-            for j in range(utilities.shape[1]):
-                cur_state = (j, i)
-                self.data[f'{cur_state}'] = [0] 
+        if self.recorder is not None:
+            self.recorder.start(utilities)
 
         # Initialize the total_iterations
         total_iterations = 0
+        self.improvement_gap = math.inf
+
+        # Residuals below the resolution of the dtype are rounding noise
+        min_tolerance = max(self.tolerance, float(bellman.utility_resolution(np.abs(mdp.reward_array).max(initial=0), self.gamma, self.dtype)))
 
         # Loop control variable
         is_policy_stable = False
@@ -77,30 +138,67 @@ class PolicyIteration():
         # Loop while the policy is not stable
         while not is_policy_stable:
             # Policy Evaluation
-            utilities, iterations = self.policy_evaluation(policy, utilities, mdp)
+            if self.evaluation == 'exact':
+                utilities, iterations = self.exact_policy_evaluation(policy, mdp)
+            elif self.evaluation == 'adaptive':
+                # Evaluate deeper as the improvement gap closes
+                tolerance = max(self.eval_ratio * self.improvement_gap, min_tolerance)
+                utilities, iterations = self.policy_evaluation(policy, utilities, mdp, tolerance)
+            else:
+                utilities, iterations = self.policy_evaluation(policy, utilities, mdp)
             total_iterations += iterations
             
             # Policy Improvement
             policy, is_policy_stable = self.policy_improvement(policy, utilities, mdp)
+
+            # A stable policy only counts once its utilities have converged
+            if self.evaluation == 'adaptive':
+                is_policy_stable = is_policy_stable and self.evaluation_residual < min_tolerance
         
+        if self.recorder is not None:
+            self.recorder.finish()
+
         # Return utilities, policy and iterations as a dictionary
         return {"utilities": utilities, "policy": policy, "iterations": total_iterations}
     
 
-    def policy_evaluation(self, policy, utilities, mdp):
+    def resolve(self, mdp, previous):
+        """
+        Re-solves the mdp after a small edit, for example to gamma or the rewards,
+        starting from the utilities and policy of a previous solve
+
+        Parameters
+        ----------
+        mdp : Environment object
+            Edited MDP to solve
+
+        previous : dictionary
+            Results of the previous solve
+
+        Returns
+        ----------
+        utilities, policy and number of iterations
+        """
+
+        return self.solve(mdp, utilities=previous['utilities'], policy=previous['policy'])
+
+    def policy_evaluation(self, policy, utilities, mdp, tolerance=None):
         """
         Updates the utilities using the current policy
 
         Parameters
         ----------
-        policy: 2D List
-            Current policy
+        policy: 2D Array
+            Current policy as action indices
 
         utilities: 2D List
             Current utilities
 
         mdp : Environment object
             an MDP with states S, actions A(s), transition model P(s | s, a)
+
+        tolerance : double, optional
+            Stop early once no utility changes by more than tolerance in an update (default is None)
         
 
         Returns
@@ -113,37 +211,31 @@ class PolicyIteration():
         # Loop control
         while iteration < self.k:
             iteration += 1
+            delta = 0
 
             # Copy current utilities
             new_utilities = utilities.copy()
+            flat_utilities = utilities.reshape(-1)
 
             for i in range(utilities.shape[0]):
                 for j in range(utilities.shape[1]):
                     cur_state = (i, j)
 
-                    # Convert to (column, row) format
-                    state_format = (cur_state[1], cur_state[0])
-
                     # Check if the current state is a wall
                     if mdp.is_wall(cur_state):
-                        self.data[f'{state_format}'].append(0)
                         continue
 
-                    # Get action from current policy
-                    action = policy[i][j]
+                    # Get action index from current policy
+                    action_idx = policy[i][j]
 
-                    # Get transition model of the MDP
-                    transition_model = mdp.transition_model(cur_state, action)
+                    # Read the compiled transition model of the MDP
+                    state_idx = mdp.state_to_index(cur_state)
 
-                    action_value = 0
+                    next_states = mdp.transition_states[state_idx, action_idx]
+                    probabilities = mdp.transition_probabilities[state_idx, action_idx]
 
-                    # Loop through all the next states in the transition model
-                    # This loop calculates expected utility for taking the action
-                    for next_state in transition_model:
-                        utility = utilities[next_state[0]][next_state[1]]
-                        probability = transition_model[next_state]
-                        expected_value = probability * utility
-                        action_value += expected_value
+                    # Expected utility for taking the action
+                    action_value = np.dot(probabilities, flat_utilities[next_states])
 
                     # Reward of current state
                     reward = mdp.receive_reward(cur_state)
@@ -152,22 +244,77 @@ class PolicyIteration():
                     utility = reward + self.gamma * action_value
                     new_utilities[i][j] = utility
 
-                    # Update analysis data
-                    self.data[f'{state_format}'].append(utility)
+                    # Update the value of delta
+                    delta = max(delta, abs(utility - utilities[i][j]))
             
             utilities = new_utilities.copy()
+            self.evaluation_residual = delta
+
+            # Update analysis data
+            if self.recorder is not None:
+                self.recorder.record(utilities)
+
+            # Check for convergence of the current policy
+            if tolerance is not None and delta < tolerance:
+                break
 
         return utilities, iteration
 
+    def exact_policy_evaluation(self, policy, mdp):
+        """
+        Calculates the utilities of the current policy exactly by solving
+        the sparse linear system (I - gamma * P_pi) V = R
+
+        Parameters
+        ----------
+        policy: 2D Array
+            Current policy as action indices
+
+        mdp : Environment object
+            an MDP with states S, actions A(s), transition model P(s | s, a)
+        
+
+        Returns
+        ----------
+        utilities, iterations
+        """
+
+        # Action index of the policy in every state
+        policy_actions = policy.reshape(-1).astype(np.intp)
+        states = np.arange(mdp.num_states)
+
+        # Successors and probabilities of the policy, walls have no transitions and a utility of 0
+        next_states = mdp.transition_states[states, policy_actions]
+        probabilities = np.where(mdp.walls[:, None], 0, mdp.transition_probabilities[states, policy_actions]).astype(self.dtype)
+        rewards = np.where(mdp.walls, 0, mdp.reward_array).astype(self.dtype)
+
+        # Transition matrix P_pi, duplicate entries are summed
+        transitions = csr_matrix(
+            (probabilities.reshape(-1), (np.repeat(states, next_states.shape[1]), next_states.reshape(-1))),
+            shape=(mdp.num_states, mdp.num_states)
+        )
+
+        system = (identity(mdp.num_states, dtype=self.dtype, format='csr') - self.dtype.type(self.gamma) * transitions).tocsc()
+        utilities = spsolve(system, rewards).astype(self.dtype, copy=False).reshape(mdp.grid_height, mdp.grid_width)
+
+        # Update analysis data
+        if self.recorder is not None:
+            self.recorder.record(utilities)
+
+        return utilities, 1
+
     def policy_improvement(self, policy, utilities, mdp):
         
         """
-        Calculates the new policy using one step look ahead
+        Calculates the new policy using one step look ahead. A state keeps its current action unless
+        another action gains more than the utility resolution of the dtype. Without this rule tied
+        actions, for example the symmetric moves of an open map, swap on rounding noise of about 1e-14
+        and exact evaluation never finds a stable policy, in float64 as well as float32
 
         Parameters
         ----------
-        policy: 2D List
-            Current policy
+        policy: 2D Array
+            Current policy as action indices
 
         utilities: 2D List
             Current utilities
@@ -182,7 +329,12 @@ class PolicyIteration():
         """
 
         # Copy current policy
-        new_policy = copy.deepcopy(policy)
+        new_policy = policy.copy()
+        flat_utilities = utilities.reshape(-1)
+        improvement_gap = 0
+
+        # Gains below the resolution of the dtype are rounding noise, switching on them can wander between tied actions forever
+        resolution = float(bellman.utility_resolution(np.abs(mdp.reward_array).max(initial=0), self.gamma, self.dtype))
 
         for i in range(utilities.shape[0]):
             for j in range(utilities.shape[1]):
@@ -192,47 +344,29 @@ class PolicyIteration():
                 if mdp.is_wall(cur_state):
                         continue
 
-                # Get all possible actions
-                actions = mdp.actions
-                action_values = {}
+                state_idx = mdp.state_to_index(cur_state)
 
-                # Loop through all possible actions
-                # This loop calculates action values for all actions
-                for action in actions:
-                    action_value = 0
+                # Expected utility for taking each action
+                action_values = (mdp.transition_probabilities[state_idx] * flat_utilities[mdp.transition_states[state_idx]]).sum(axis=1)
 
-                    # Get transition model
-                    transition_model = mdp.transition_model(cur_state, action)
+                # Choose the action that maximizes expected utility
+                best_action = np.argmax(action_values)
+                best_action_value = action_values[best_action]
 
-                    # Loop through all the next states in the transition model
-                    # This loop calculates expected utility for taking the action
-                    for next_state in transition_model:
-                        utility = utilities[next_state[0]][next_state[1]]
-                        probability = transition_model[next_state]
-                        expected_utility = probability * utility
-                        action_value += expected_utility
+                # Gain over the action of the current policy
+                current_action_value = action_values[policy[i][j]]
+                gain = self.gamma * (best_action_value - current_action_value)
+                improvement_gap = max(improvement_gap, gain)
 
-                    # Set action value for the action
-                    action_values[action] = action_value
+                # Keep the current action unless the best action is clearly better
+                if gain > resolution:
+                    new_policy[i][j] = best_action
 
-                best_action = None
-                best_action_value = -math.inf
-
-                # This loop chooses the action that maximizes expected utility
-                for action in action_values:
-                    if action_values[action] > best_action_value:
-                        best_action = action
-                        best_action_value = action_values[action]
-                new_policy[i][j] = best_action
+        self.improvement_gap = improvement_gap
 
         # Checks if the old policy is same as the new policy
         # If the old policy is same as the new policy, the policy is stable
-        for i in range(len(policy)):
-            for j in range(len(policy[i])):
-                if policy[i][j] != new_policy[i][j]:
-                    return new_policy, False
-        
-        return new_policy, True
+        return new_policy, np.array_equal(policy, new_policy)
 
     def get_starting_policy(self, mdp):
         """
@@ -244,13 +378,16 @@ class PolicyIteration():
             an MDP with states S, actions A(s), transition model P(s | s, a)
         """
 
-        # Initialize the starting policy
-        policy = [[(-1, 0) for _ in range(mdp.grid_width)] for _ in range(mdp.grid_height)]
+        # Initialize the starting policy with the action index of NORTH
+        policy = np.full((mdp.grid_height, mdp.grid_width), mdp.action_index[(-1, 0)], dtype=np.int8)
         return policy
 
     def get_data(self):
         """
-        Returns data for analysis
+        Returns data for analysis as a dictionary of per-state utilities, empty when recording is disabled
         """
 
-        return self.data
+        if self.recorder is None:
+            return {}
+
+        return self.recorder.to_dict()
@@ -1,47 +1,16 @@
 import numpy as np
-import random
 
-class QLearning():
+from mdp.algorithms.td import TemporalDifference
 
-    def __init__(self, n_w, n_h, n_actions, gamma=0.99, step_size=0.1, num_episodes=50000, num_steps=100, epsilon=0.1) -> None:
-        self.q_table = np.zeros((n_h, n_w, n_actions))
-        self.n_h = n_h
-        self.n_w = n_w
-        self.n_actions = n_actions
-        self.gamma = gamma
-        self.alpha = step_size
-        self.num_episodes=num_episodes
-        self.num_steps=num_steps
-        self.epsilon = epsilon
 
-    def solve(self, mdp):
+class QLearning(TemporalDifference):
 
-        # Solve and return Q_table
-        for episode in range(self.num_episodes):
+    """
+    Q-learning, the TD target uses the greedy action in the next state
+    """
 
-            state = self.get_starting_state(mdp, self.q_table.shape[0], self.q_table.shape[1])
-
-            for step in range(self.num_steps):
-                
-                rand_num = random.uniform(0, 1)
-                if rand_num <= self.epsilon:
-                    action = random.randint(0, self.n_actions-1)
-                else:
-                    action = np.argmax(self.q_table[state[0]][state[1]])
-
-                next_state, reward = mdp.step(state, mdp.action_map(action))
-
-                self.q_table[state[0]][state[1]][action] = self.q_table[state[0]][state[1]][action] + self.alpha * (reward + self.gamma * np.max(self.q_table[next_state[0]][next_state[1]]) - self.q_table[state[0]][state[1]][action])
-
-                state = next_state
-
-        return self.q_table
-
-    def get_starting_state(self, mdp, n_h, n_w):
-
-        state = (random.randint(0, n_h-1), random.randint(0, n_w-1))
-
-        while mdp.is_wall(state):
-            state = (random.randint(0, n_h-1), random.randint(0, n_w-1))
-        
-        return state
+    def __init__(self, n_w, n_h, n_actions, gamma=0.99, step_size=0.1, num_episodes=50000, num_steps=100, epsilon=0.1, dtype=np.float64, num_agents=1, seed=None,
+                 num_workers=1, tolerance=None, stable_intervals=10, monitor_seconds=1.0, stopping=None) -> None:
+        super().__init__(n_w, n_h, n_actions, target='max', gamma=gamma, step_size=step_size, num_episodes=num_episodes,
+                         num_steps=num_steps, epsilon=epsilon, dtype=dtype, num_agents=num_agents, seed=seed,
+                         num_workers=num_workers, tolerance=tolerance, stable_intervals=stable_intervals, monitor_seconds=monitor_seconds, stopping=stopping)
@@ -0,0 +1,350 @@
+import numpy as np
+
+from mdp.algorithms import bellman
+from mdp.utils.random_stream import RandomStream
+
+
+class RTDP():
+
+    """
+    Real-Time Dynamic Programming Class
+    Backs up only the states visited by greedy simulated trials from the start states.
+    The trials start from an upper bound on the optimal utilities built by a cheap vectorized pre-solve,
+    so the greedy policy heads for the rewards from the first trial instead of exploring the whole grid.
+
+    Bounded RTDP also backs up a lower bound and samples the successors in proportion to their probability
+    times the gap between the bounds. It stops once the bounds of the start states are within epsilon.
+    States the greedy policy reaches with a tiny probability then barely matter, which they do for labeling.
+    With labeling (LRTDP), a state is marked solved once every state reachable from it under the greedy policy
+    has a Bellman error below the threshold
+
+    Attributes
+    ----------
+    gamma : double
+        Discount factor of the mdp
+    max_depth : int
+        Maximum number of steps of a trial
+    max_trials : int
+        Maximum number of trials
+    method : str
+        'bounded' (BRTDP), 'labeled' (LRTDP) or 'plain' (RTDP that runs max_trials trials)
+    horizon : int
+        Number of steps of the finite horizon values the bounds are built from
+    gap_ratio : double
+        A bounded trial ends once the expected gap of the next state falls below the gap of its start state divided by gap_ratio
+    random_stream : RandomStream object
+        Source of the transition samples of the trials
+    backups : int
+        Number of single-state backups of the last solve
+
+    Methods
+    ----------
+    solve(mdp, start_states, epsilon, heuristic): Solves the mdp from the start states
+    get_bounds(mdp): Returns an upper and a lower bound on the optimal utilities
+    bounded_trial(...): Runs one trial of bounded RTDP
+    trial(...): Runs one greedy simulated trial of RTDP or LRTDP
+    check_solved(...): Labels the states reachable under the greedy policy once they have converged
+    """
+
+    def __init__(self, gamma=0.99, max_depth=100, max_trials=100000, method='bounded', horizon=32, gap_ratio=10, seed=None):
+        """
+        Parameters
+        ----------
+        gamma : double, optional
+            Discount Factor of the algorithm (default is 0.99)
+        max_depth : int, optional
+            Maximum number of steps of a trial (default is 100)
+        max_trials : int, optional
+            Maximum number of trials (default is 100000)
+        method : str, optional
+            'bounded' stops once the bounds of the start states are within epsilon, 'labeled' stops once the
+            start states are labeled solved, 'plain' runs max_trials trials (default is 'bounded')
+        horizon : int, optional
+            Number of steps of the finite horizon values the bounds are built from, every step costs two
+            vectorized backups of the whole grid (default is 32)
+        gap_ratio : double, optional
+            A bounded trial ends once the expected gap of the next state falls below the gap of its start state
+            divided by gap_ratio (default is 10)
+        seed : int, SeedSequence or Generator, optional
+            Seed of the random stream, the same seed reproduces a solve (default is None, fresh entropy)
+        """
+
+        if method not in ('bounded', 'labeled', 'plain'):
+            raise ValueError(f"Unknown RTDP method: {method}")
+
+        self.gamma = gamma
+        self.max_depth = max_depth
+        self.max_trials = max_trials
+        self.method = method
+        self.horizon = horizon
+        self.gap_ratio = gap_ratio
+        self.random_stream = RandomStream(seed)
+        self.backups = 0
+
+
+    def solve(self, mdp, start_states, epsilon, heuristic=None):
+        """
+        Solves the mdp from the start states
+
+        Parameters
+        ----------
+        mdp : Environment object
+            MDP to solve
+
+        start_states : List
+            States (row, column) the policy is queried from
+
+        epsilon : double
+            Maximum error allowed in the utility of the start states
+
+        heuristic : 2-D Array, optional
+            Initial utilities of the states, must not be below the optimal utilities
+            (default is None, the upper bound of get_bounds)
+
+        Returns
+        ----------
+        utilities, policy, number of trials as iterations, number of backups, the mask of visited states
+        and whether the solve converged as a dictionary. The utilities are upper bounds on the optimal
+        utilities. Bounded RTDP also returns the lower bounds as lower_utilities, and its policy is greedy
+        with respect to them, which guarantees a utility within epsilon of the optimal one from every start state.
+        converged is False when max_trials runs out first, and always False for plain RTDP
+        """
+
+        upper, lower = self.get_bounds(mdp)
+
+        if heuristic is not None:
+            upper = np.array(heuristic, dtype=np.float64).reshape(-1)
+            upper[mdp.walls] = 0
+
+        values = upper.tolist()
+        lower_values = lower.tolist()
+        rewards, transition_states, transition_probabilities = bellman.model_lists(mdp)
+
+        solved = [False] * mdp.num_states
+        visited = np.zeros(mdp.num_states, dtype=bool)
+
+        # Calculate the threshold
+        threshold = epsilon * (1 - self.gamma) / self.gamma
+
+        self.backups = 0
+        starts = [mdp.state_to_index(state) for state in start_states]
+
+        trials = 0
+        converged = False
+
+        while trials < self.max_trials:
+
+            if self.method == 'bounded':
+                # Refine the start state with the widest gap
+                gap, start = max((values[start] - lower_values[start], start) for start in starts)
+                converged = gap <= epsilon
+            else:
+                converged = self.method == 'labeled' and all(solved[start] for start in starts)
+                start = starts[trials % len(starts)]
+
+            if converged:
+                break
+
+            trials += 1
+
+            if self.method == 'bounded':
+                self.bounded_trial(start, values, lower_values, rewards, transition_states, transition_probabilities, visited)
+            else:
+                self.trial(start, values, rewards, transition_states, transition_probabilities, solved, visited, threshold)
+
+        utilities = np.array(values, dtype=np.float64).reshape(mdp.grid_height, mdp.grid_width)
+        lower_utilities = np.array(lower_values, dtype=np.float64).reshape(utilities.shape)
+
+        # Greedy policy with respect to the lower bounds for bounded RTDP, the utilities otherwise
+        policy_utilities = lower_utilities if self.method == 'bounded' else utilities
+        policy = np.argmax(bellman.action_values(policy_utilities, mdp), axis=0).astype(np.int8)
+        policy[mdp.walls.reshape(utilities.shape)] = 0
+
+        results = {"utilities": utilities, "policy": policy, "iterations": trials, "backups": self.backups,
+                   "visited": visited.reshape(utilities.shape), "converged": converged}
+
+        if self.method == 'bounded':
+            results["lower_utilities"] = lower_utilities
+
+        return results
+
+
+    def get_bounds(self, mdp):
+        """
+        Returns an upper and a lower bound on the optimal utilities, built with vectorized backups of the whole grid.
+
+        The upper bound splits a trajectory into blocks of horizon steps. Block j starts at most j * horizon moves
+        away and collects at most the best horizon-step utility H within that distance, so the sum over j of
+        gamma ** (j * horizon) times it bounds any policy. H already pays for the slips and for leaving a
+        rewarding cell, which the largest reward / (1 - gamma) everywhere does not. The bound only changes every
+        horizon moves, so horizon backups follow to rank the states within a block by their distance to the rewards.
+        The lower bound is horizon backups of the smallest reward / (1 - gamma). Backups keep both bounds valid
+
+        Parameters
+        ----------
+        mdp : Environment object
+            MDP to bound
+
+        Returns
+        ----------
+        flat upper bound, flat lower bound
+        """
+
+        shape = (mdp.grid_height, mdp.grid_width)
+        walls = mdp.walls.reshape(shape)
+        rewards = mdp.reward_array.reshape(shape)
+
+        # Best expected utility of the next horizon steps
+        horizon_utilities = rewards.copy()
+        for step in range(self.horizon - 1):
+            horizon_utilities = rewards + self.gamma * bellman.action_values(horizon_utilities, mdp).max(axis=0)
+
+        block_discount = self.gamma ** self.horizon
+
+        # Best horizon-step utility within j * horizon moves, walls never collect theirs
+        best_utilities = np.where(walls, -np.inf, horizon_utilities)
+        upper = np.zeros(shape)
+        discount = 1.0
+
+        while True:
+            upper += discount * best_utilities
+            discount *= block_discount
+
+            next_best_utilities = best_utilities
+            for step in range(self.horizon):
+                next_best_utilities = np.maximum(next_best_utilities, bellman.shift_utilities(next_best_utilities, mdp).max(axis=0))
+
+            # Once no state can reach a better block, the rest of the series is geometric
+            if np.array_equal(next_best_utilities, best_utilities):
+                upper += discount * best_utilities / (1 - block_discount)
+                break
+
+            best_utilities = next_best_utilities
+
+        upper = np.where(walls, 0, upper)
+        lower = np.where(walls, 0, np.min(mdp.reward_array[~mdp.walls]) / (1 - self.gamma))
+
+        for step in range(self.horizon):
+            upper = np.where(walls, 0, rewards + self.gamma * bellman.action_values(upper, mdp).max(axis=0))
+            lower = np.where(walls, 0, rewards + self.gamma * bellman.action_values(lower, mdp).max(axis=0))
+
+        return upper.reshape(-1), lower.reshape(-1)
+
+
+    def bounded_trial(self, state_idx, values, lower_values, rewards, transition_states, transition_probabilities, visited):
+        """
+        Runs one trial of bounded RTDP from the state, sampling the successors of the greedy action
+        in proportion to their probability times their gap, then backs up the visited states in reverse order
+        """
+
+        path = []
+        start_gap = values[state_idx] - lower_values[state_idx]
+
+        while len(path) < self.max_depth:
+            path.append(state_idx)
+            visited[state_idx] = True
+
+            # Bellman Update of both bounds of the visited state
+            action_idx, action_value = bellman.greedy_action(state_idx, values, transition_states, transition_probabilities)
+            values[state_idx] = rewards[state_idx] + self.gamma * action_value
+            lower_values[state_idx] = rewards[state_idx] + self.gamma * bellman.greedy_action(state_idx, lower_values, transition_states, transition_probabilities)[1]
+            self.backups += 1
+
+            next_states = transition_states[state_idx][action_idx]
+            weights = [probability * (values[next_state] - lower_values[next_state]) for next_state, probability in zip(next_states, transition_probabilities[state_idx][action_idx])]
+            total_weight = weights[0] + weights[1] + weights[2]
+
+            # Stop where the rest of the trajectory can barely change the start state
+            if total_weight <= start_gap / self.gap_ratio:
+                break
+
+            # Sample the next state in proportion to its weight
+            rand_num = self.random_stream.random() * total_weight
+            if rand_num < weights[0]:
+                state_idx = next_states[0]
+            elif rand_num < weights[0] + weights[1]:
+                state_idx = next_states[1]
+            else:
+                state_idx = next_states[2]
+
+        while path:
+            state_idx = path.pop()
+            values[state_idx] = rewards[state_idx] + self.gamma * bellman.greedy_action(state_idx, values, transition_states, transition_probabilities)[1]
+            lower_values[state_idx] = rewards[state_idx] + self.gamma * bellman.greedy_action(state_idx, lower_values, transition_states, transition_probabilities)[1]
+            self.backups += 1
+
+
+    def trial(self, state_idx, values, rewards, transition_states, transition_probabilities, solved, visited, threshold):
+        """
+        Runs one greedy simulated trial from the state, backing up every visited state,
+        then with labeling checks the visited states for convergence in reverse order
+        """
+
+        path = []
+
+        while not solved[state_idx] and len(path) < self.max_depth:
+            path.append(state_idx)
+            visited[state_idx] = True
+
+            # Bellman Update of the visited state
+            action_idx, action_value = bellman.greedy_action(state_idx, values, transition_states, transition_probabilities)
+            values[state_idx] = rewards[state_idx] + self.gamma * action_value
+            self.backups += 1
+
+            # Sample the next state of the greedy action
+            rand_num = self.random_stream.random()
+            cont_prob = 0
+            for next_state, probability in zip(transition_states[state_idx][action_idx], transition_probabilities[state_idx][action_idx]):
+                cont_prob += probability
+                if probability > 0 and rand_num <= cont_prob:
+                    break
+
+            state_idx = next_state
+
+        if self.method != 'labeled':
+            return
+
+        # Label the visited states, stop at the first one that is not solved yet
+        while path:
+            if not self.check_solved(path.pop(), values, rewards, transition_states, transition_probabilities, solved, threshold):
+                break
+
+
+    def check_solved(self, state_idx, values, rewards, transition_states, transition_probabilities, solved, threshold):
+        """
+        Labels the state and every state reachable from it under the greedy policy as solved
+        if all of them have a Bellman error below the threshold, otherwise backs them up
+        """
+
+        converged = True
+        open_states = [] if solved[state_idx] else [state_idx]
+        closed_states = []
+        seen = set(open_states)
+
+        while open_states:
+            state_idx = open_states.pop()
+            closed_states.append(state_idx)
+
+            action_idx, action_value = bellman.greedy_action(state_idx, values, transition_states, transition_probabilities)
+
+            # Do not expand states that are still changing
+            if abs(rewards[state_idx] + self.gamma * action_value - values[state_idx]) >= threshold:
+                converged = False
+                continue
+
+            for next_state, probability in zip(transition_states[state_idx][action_idx], transition_probabilities[state_idx][action_idx]):
+                if probability > 0 and not solved[next_state] and next_state not in seen:
+                    seen.add(next_state)
+                    open_states.append(next_state)
+
+        if converged:
+            for closed_state in closed_states:
+                solved[closed_state] = True
+        else:
+            # Back up the states in reverse order of discovery
+            for closed_state in reversed(closed_states):
+                action_idx, action_value = bellman.greedy_action(closed_state, values, transition_states, transition_probabilities)
+                values[closed_state] = rewards[closed_state] + self.gamma * action_value
+                self.backups += 1
+
+        return converged
@@ -0,0 +1,613 @@
+"""
+One-step temporal difference control on a flat Q-table
+
+Q-learning, SARSA and Expected SARSA differ only in the value of the next state used in the
+TD target. The engine keeps the Q-values as one contiguous array of shape (num_states, num_actions)
+indexed by the flat state index of the Environment, and samples transitions from its compiled model.
+
+With several agents the episodes run in lockstep: every step selects the actions, samples the
+transitions and applies the TD updates of all the agents with array operations. Agents updating
+the same state-action pair in a step all see its old value. Their TD errors are accumulated and
+applied as k sequential updates toward their mean target would be, so the pair moves by
+1 - (1 - alpha) ** k of the mean error instead of diverging when k * alpha exceeds 1.
+"""
+
+
+import time
+from multiprocessing import Process
+from multiprocessing.connection import wait
+
+import numpy as np
+
+from mdp.algorithms import hogwild, parallel
+from mdp.utils.random_stream import RandomStream
+
+
+# Target functions take the Q-values of the next state, shape (num_actions,), or of the next states
+# of many agents, shape (num_agents, num_actions), with the matching next actions
+
+def max_target(next_values, next_action, epsilon):
+    """
+    Q-learning target, the value of the greedy action in the next state
+    """
+    return next_values.max(axis=-1)
+
+
+def sampled_target(next_values, next_action, epsilon):
+    """
+    SARSA target, the value of the action taken in the next state
+    """
+    if next_values.ndim == 1:
+        return next_values[next_action]
+
+    return next_values[np.arange(next_values.shape[0]), next_action]
+
+
+def expected_target(next_values, next_action, epsilon):
+    """
+    Expected SARSA target, the expected value of the next state under the epsilon-greedy policy.
+    Every action is explored with probability epsilon / num_actions and the greedy action
+    gets the remaining 1 - epsilon on top
+    """
+    return (1 - epsilon) * next_values.max(axis=-1) + epsilon * next_values.mean(axis=-1)
+
+
+# TD targets by name, a target is on-policy when it needs the next action before the update
+TARGETS = {
+    'max': (max_target, False),
+    'sampled': (sampled_target, True),
+    'expectation': (expected_target, False),
+}
+
+
+def apply_updates(q_values, states, actions, td_targets, alpha):
+    """
+    Applies the TD updates of many agents to the Q-table in place
+
+    Parameters
+    ----------
+    q_values : 2-D Array
+        Flat Q-table of shape (num_states, num_actions)
+    states : 1-D Array
+        Flat indices of the updated states
+    actions : 1-D Array
+        Indices of the updated actions
+    td_targets : 1-D Array
+        TD target of every update
+    alpha : double
+        Step size
+    """
+
+    flat_values = q_values.reshape(-1)
+    pairs = states * q_values.shape[1] + actions
+
+    # Accumulate the TD errors of the agents that updated the same pair
+    unique_pairs, inverse, counts = np.unique(pairs, return_inverse=True, return_counts=True)
+    errors = np.bincount(inverse.reshape(-1), weights=td_targets - flat_values[pairs], minlength=len(unique_pairs))
+
+    # k updates toward the same target close 1 - (1 - alpha) ** k of the error
+    flat_values[unique_pairs] += ((1 - (1 - alpha) ** counts) * errors / counts).astype(q_values.dtype)
+
+
+class TemporalDifference():
+
+    """
+    Temporal Difference Learning Class
+
+    Attributes
+    ----------
+    n_w : int
+        Width of the grid
+    n_h : int
+        Height of the grid
+    n_actions : int
+        Number of actions
+    target : str
+        Value of the next state used in the TD target, 'max', 'sampled' or 'expectation'
+    gamma : double
+        Discount factor
+    alpha : double
+        Step size
+    num_episodes : int
+        Number of episodes
+    num_steps : int
+        Number of steps per episode
+    epsilon : double
+        Exploration rate of the epsilon-greedy policy
+    num_agents : int
+        Number of agents stepping in lockstep
+    num_workers : int
+        Number of worker processes updating a shared Q-table without locks
+    tolerance : double
+        Smallest Q-value gain of a greedy action switch that counts as a policy change of the asynchronous workers
+    stable_intervals : int
+        Number of monitor intervals in a row without a policy change after which the asynchronous workers are stopped
+    monitor_seconds : double
+        Seconds between two checks of the asynchronous workers
+    stopping : EarlyStopping object
+        Criteria checked every few episodes to end the run before the whole budget is used
+    stop_reason : str
+        Why the last solve ended, 'budget' when it ran every episode
+    episodes : int
+        Number of episodes the last solve ran
+    random_stream : RandomStream object
+        Source of the exploration and transition samples
+    q_values : 2-D Array
+        Flat Q-table of shape (num_states, num_actions), the row of a state is its flat index
+    q_table : 3-D Array
+        View of q_values with shape (n_h, n_w, n_actions)
+
+    Methods
+    ----------
+    solve(mdp): Learns the Q-table
+    start(mdp): Resets the stop reason, the episode count and the stopping criteria
+    results(): Returns the Q-table, or with early stopping the Q-table, stop reason and episode count
+    solve_batched(mdp): Learns the Q-table with many agents in lockstep
+    solve_hogwild(mdp): Learns the Q-table with worker processes updating a shared Q-table without locks
+    run_episodes(mdp, num_episodes, control, worker_idx): Runs episodes of a single agent
+    observe(state, action, next_state, reward): Called after the TD update of every transition
+    end_episode(num_episodes): Called after every episode, or every round of episodes of the agents
+    choose_action(values): Chooses an epsilon-greedy action from the Q-values of a state
+    choose_actions(values): Chooses the epsilon-greedy actions of many agents
+    get_starting_state(mdp, n_h, n_w): Returns a random non-wall starting state
+    """
+
+    def __init__(self, n_w, n_h, n_actions, target='max', gamma=0.99, step_size=0.1, num_episodes=50000, num_steps=100, epsilon=0.1, dtype=np.float64, num_agents=1, seed=None,
+                 num_workers=1, tolerance=None, stable_intervals=10, monitor_seconds=1.0, stopping=None) -> None:
+
+        """
+        Parameters
+        ----------
+        n_w : int
+            Width of the grid
+        n_h : int
+            Height of the grid
+        n_actions : int
+            Number of actions
+        target : str, optional
+            'max' (Q-learning), 'sampled' (SARSA) or 'expectation' (Expected SARSA) (default is 'max')
+        gamma : double, optional
+            Discount factor (default is 0.99)
+        step_size : double, optional
+            Step size (default is 0.1)
+        num_episodes : int, optional
+            Number of episodes (default is 50000)
+        num_steps : int, optional
+            Number of steps per episode (default is 100)
+        epsilon : double, optional
+            Exploration rate of the epsilon-greedy policy (default is 0.1)
+        dtype : data-type, optional
+            Floating point type of the Q-table (default is np.float64)
+        num_agents : int, optional
+            Number of agents stepping in lockstep. The num_episodes episodes are run num_agents at a time,
+            so the budget stays num_episodes * num_steps transitions (default is 1)
+        seed : int, SeedSequence or Generator, optional
+            Seed of the random stream, the same seed reproduces a run (default is None, fresh entropy)
+        num_workers : int, optional
+            Number of worker processes. Above 1 every worker acts in its own copy of the Environment and
+            updates one Q-table in shared memory without locks, the num_episodes episodes are split
+            between the workers (default is 1)
+        tolerance : double, optional
+            The workers are stopped early once no greedy action was replaced by one whose Q-value is higher
+            by more than tolerance for stable_intervals monitor intervals in a row. With a constant step size
+            the Q-values never settle and actions with nearly tied Q-values keep swapping, so a stop on the
+            Q-value change or on an unchanged policy is not reliable, the tolerance must cover that noise,
+            about 1.0 on the demo grid with step size 0.1 (default is None, run the whole budget)
+        stable_intervals : int, optional
+            Number of monitor intervals in a row without a policy change before the workers are stopped (default is 10)
+        monitor_seconds : double, optional
+            Seconds between two checks of the asynchronous workers (default is 1.0)
+        stopping : EarlyStopping object, optional
+            Criteria checked every stopping.check_interval episodes, solve then returns the Q-table
+            with the stop reason and the episode count (default is None, run the whole budget)
+        """
+
+        if target not in TARGETS:
+            raise ValueError(f"Unknown TD target: {target}")
+
+        self.q_values = np.zeros((n_h * n_w, n_actions), dtype=dtype)
+        self.q_table = self.q_values.reshape(n_h, n_w, n_actions)
+        self.n_h = n_h
+        self.n_w = n_w
+        self.n_actions = n_actions
+        self.target = target
+        self.gamma = gamma
+        self.alpha = step_size
+        self.num_episodes = num_episodes
+        self.num_steps = num_steps
+        self.epsilon = epsilon
+        self.num_agents = num_agents
+        self.num_workers = num_workers
+        self.tolerance = tolerance
+        self.stable_intervals = stable_intervals
+        self.monitor_seconds = monitor_seconds
+        self.stopping = stopping
+        self.stop_reason = None
+        self.episodes = 0
+        self.random_stream = RandomStream(seed)
+
+    def solve(self, mdp):
+        """
+        Learns the Q-table from episodes of epsilon-greedy interaction with the MDP
+
+        Parameters
+        ----------
+        mdp : Environment object
+            MDP to learn
+
+        Returns
+        ----------
+        Q-table of shape (n_h, n_w, n_actions), with early stopping a dictionary of the Q-table,
+        the stop reason and the number of episodes run
+        """
+
+        if self.num_workers > 1:
+            self.solve_hogwild(mdp)
+
+        elif self.num_agents > 1:
+            self.solve_batched(mdp)
+
+        else:
+            self.start(mdp)
+            self.episodes = self.run_episodes(mdp, self.num_episodes)
+
+        return self.results()
+
+    def start(self, mdp):
+        """
+        Resets the stop reason, the episode count and the stopping criteria before a solve
+
+        Parameters
+        ----------
+        mdp : Environment object
+            MDP to learn
+        """
+
+        self.stop_reason = 'budget'
+        self.episodes = 0
+
+        if self.stopping is not None:
+            self.stopping.reset(self.q_values, mdp.walls)
+
+    def results(self):
+        """
+        Returns the Q-table of shape (n_h, n_w, n_actions), or with early stopping a dictionary
+        of the Q-table, the stop reason and the number of episodes run
+        """
+
+        if self.stopping is None:
+            return self.q_table
+
+        return {"q_table": self.q_table, "stop_reason": self.stop_reason, "episodes": self.episodes}
+
+    def run_episodes(self, mdp, num_episodes, control=None, worker_idx=0):
+        """
+        Runs episodes of a single agent, updating the Q-table after every step
+
+        Parameters
+        ----------
+        mdp : Environment object
+            MDP to learn
+        num_episodes : int
+            Number of episodes
+        control : 1-D Array, optional
+            Shared stop flag followed by the episode counter of every worker (default is None, not a worker)
+        worker_idx : int, optional
+            Index of the worker's episode counter (default is 0)
+
+        Returns
+        ----------
+        Number of episodes run
+        """
+
+        target_function, on_policy = TARGETS[self.target]
+
+        q_values = self.q_values
+        gamma = self.gamma
+        alpha = self.alpha
+        epsilon = self.epsilon
+        random_stream = self.random_stream
+
+        # Workers leave the stopping criteria to the main process
+        stopping = self.stopping if control is None else None
+        episodes = 0
+
+        for episode in range(num_episodes):
+
+            state = mdp.state_to_index(self.get_starting_state(mdp, self.n_h, self.n_w))
+            action = self.choose_action(q_values[state])
+
+            for step in range(self.num_steps):
+
+                next_state, reward = mdp.step_index(state, action, random_stream.random())
+                next_values = q_values[next_state]
+
+                # SARSA commits to the next action before the update, the off-policy targets choose it after
+                next_action = self.choose_action(next_values) if on_policy else None
+
+                # TD update of the state-action pair
+                td_target = reward + gamma * target_function(next_values, next_action, epsilon)
+                q_values[state, action] += alpha * (td_target - q_values[state, action])
+
+                self.observe(state, action, next_state, reward)
+
+                if not on_policy:
+                    next_action = self.choose_action(next_values)
+
+                state = next_state
+                action = next_action
+
+            self.end_episode(1)
+            episodes += 1
+
+            if control is not None:
+                control[1 + worker_idx] += 1
+
+                # Stop flag set by the main process
+                if control[0]:
+                    break
+
+            if stopping is not None and episodes % stopping.check_interval == 0:
+                reason = stopping.check(q_values)
+
+                if reason is not None:
+                    self.stop_reason = reason
+                    break
+
+        return episodes
+
+    def solve_hogwild(self, mdp):
+        """
+        Learns the Q-table with num_workers processes, each acting in its own copy of the Environment
+        and updating a Q-table in shared memory without locks. The main process checks the Q-table
+        every monitor_seconds seconds and stops the workers once it has converged, or once the
+        stopping criteria hold. The criteria are checked every stopping.check_interval episodes
+        of all the workers together, the monitor wakes up in time at the workers' episode rate
+
+        Parameters
+        ----------
+        mdp : Environment object
+            MDP to learn
+
+        Returns
+        ----------
+        Q-table of shape (n_h, n_w, n_actions)
+        """
+
+        self.start(mdp)
+
+        # Share of the episodes and seed of every worker
+        budgets = [len(episodes) for episodes in np.array_split(np.arange(self.num_episodes), self.num_workers)]
+        seeds = self.random_stream.integers_array(2 ** 62, self.num_workers).tolist()
+
+        blocks = []
+        processes = []
+
+        try:
+            q_block, q_values = parallel.create_shared_array(self.q_values)
+            blocks.append(q_block)
+            control_block, control = parallel.create_shared_array(np.zeros(self.num_workers + 1, dtype=np.int64))
+            blocks.append(control_block)
+
+            q_spec = (q_block.name, q_values.shape, q_values.dtype)
+            control_spec = (control_block.name, control.shape, control.dtype)
+
+            for worker_idx in range(self.num_workers):
+                process = Process(target=hogwild.run_worker, args=(self, mdp, q_spec, control_spec, worker_idx, budgets[worker_idx], seeds[worker_idx]))
+                process.start()
+                processes.append(process)
+
+            previous = q_values.copy()
+            stable = 0
+            start_time = previous_time = time.monotonic()
+            next_check = self.stopping.check_interval if self.stopping is not None else None
+            episodes = 0
+
+            while any(process.is_alive() for process in processes):
+
+                # With stopping criteria, wake up when the workers should reach the next check at their
+                # current rate, so the criteria see the Q-table every check_interval episodes as in a single run
+                timeout = self.monitor_seconds
+                if next_check is not None and episodes > 0:
+                    timeout = min(timeout, (next_check - episodes) * (time.monotonic() - start_time) / episodes)
+
+                # Wake up when a worker finishes or the timeout has passed
+                wait([process.sentinel for process in processes if process.is_alive()], timeout=max(timeout, 1e-3))
+
+                episodes = int(control[1:].sum())
+
+                if next_check is not None and episodes >= next_check:
+                    next_check = (episodes // self.stopping.check_interval + 1) * self.stopping.check_interval
+                    reason = self.stopping.check(q_values)
+
+                    if reason is not None:
+                        self.stop_reason = reason
+                        control[0] = 1
+                        break
+
+                # A worker that finishes wakes the monitor early, the Q-values are only compared over a full interval
+                if self.tolerance is None or time.monotonic() - previous_time < self.monitor_seconds:
+                    continue
+
+                # Gain of the new greedy action over the previous one, swaps between nearly tied actions are noise
+                current = q_values.copy()
+                states = np.arange(current.shape[0])
+                gains = current[states, current.argmax(axis=1)] - current[states, previous.argmax(axis=1)]
+                stable = stable + 1 if gains.max() <= self.tolerance else 0
+
+                if stable >= self.stable_intervals:
+                    self.stop_reason = 'policy_stable'
+                    control[0] = 1
+                    break
+
+                previous = current
+                previous_time = time.monotonic()
+
+            for process in processes:
+                process.join()
+
+            self.q_values[:] = q_values
+            self.episodes = int(control[1:].sum())
+            del q_values, control
+
+        finally:
+            for process in processes:
+                if process.is_alive():
+                    process.terminate()
+
+            for block in blocks:
+                block.close()
+                block.unlink()
+
+        return self.q_table
+
+    def solve_batched(self, mdp):
+        """
+        Learns the Q-table with num_agents agents running their episodes in lockstep
+
+        Parameters
+        ----------
+        mdp : Environment object
+            MDP to learn
+
+        Returns
+        ----------
+        Q-table of shape (n_h, n_w, n_actions)
+        """
+
+        target_function, on_policy = TARGETS[self.target]
+
+        q_values = self.q_values
+        gamma = self.gamma
+        alpha = self.alpha
+        epsilon = self.epsilon
+        random_stream = self.random_stream
+
+        self.start(mdp)
+
+        open_states = np.flatnonzero(~mdp.walls)
+        episodes = 0
+        next_check = self.stopping.check_interval if self.stopping is not None else None
+
+        while episodes < self.num_episodes:
+
+            # The last round only runs the episodes left in the budget
+            num_agents = min(self.num_agents, self.num_episodes - episodes)
+
+            states = open_states[random_stream.integers_array(len(open_states), num_agents)]
+            actions = self.choose_actions(q_values[states])
+
+            for step in range(self.num_steps):
+
+                next_states, rewards = mdp.step_indices(states, actions, random_stream.random_array(num_agents))
+                next_values = q_values[next_states]
+
+                next_actions = self.choose_actions(next_values) if on_policy else None
+
+                # TD updates of all the agents
+                td_targets = rewards + gamma * target_function(next_values, next_actions, epsilon)
+                apply_updates(q_values, states, actions, td_targets, alpha)
+
+                self.observe(states, actions, next_states, rewards)
+
+                if not on_policy:
+                    next_actions = self.choose_actions(q_values[next_states])
+
+                states = next_states
+                actions = next_actions
+
+            episodes += num_agents
+            self.end_episode(num_agents)
+
+            # A round of many agents checks once it passed the next multiple of the interval
+            if next_check is not None and episodes >= next_check:
+                next_check = (episodes // self.stopping.check_interval + 1) * self.stopping.check_interval
+                reason = self.stopping.check(q_values)
+
+                if reason is not None:
+                    self.stop_reason = reason
+                    break
+
+        self.episodes = episodes
+
+        return self.q_table
+
+    def observe(self, state, action, next_state, reward):
+        """
+        Called after the TD update of every transition, with scalars or with arrays of
+        the transitions of all the agents. Learners that keep a model of the MDP record it here
+
+        Parameters
+        ----------
+        state : int or 1-D Array
+            Flat index of the state
+        action : int or 1-D Array
+            Index of the action
+        next_state : int or 1-D Array
+            Flat index of the next state
+        reward : double or 1-D Array
+            Reward received
+        """
+
+    def end_episode(self, num_episodes):
+        """
+        Called after every episode, or after every round of episodes when the agents run in lockstep
+
+        Parameters
+        ----------
+        num_episodes : int
+            Number of episodes that just ended
+        """
+
+    def choose_action(self, values):
+        """
+        Chooses an epsilon-greedy action
+
+        Parameters
+        ----------
+        values : 1-D Array
+            Q-values of the actions in the current state
+        """
+
+        if self.random_stream.random() <= self.epsilon:
+            return self.random_stream.integers(self.n_actions)
+
+        return int(values.argmax())
+
+    def choose_actions(self, values):
+        """
+        Chooses the epsilon-greedy actions of many agents
+
+        Parameters
+        ----------
+        values : 2-D Array
+            Q-values of the actions in the current state of each agent, shape (num_agents, num_actions)
+        """
+
+        actions = values.argmax(axis=1)
+
+        explore = self.random_stream.random_array(values.shape[0]) <= self.epsilon
+        actions[explore] = self.random_stream.integers_array(self.n_actions, np.count_nonzero(explore))
+
+        return actions
+
+    def get_starting_state(self, mdp, n_h, n_w):
+        """
+        Returns a random non-wall state (row, column)
+
+        Parameters
+        ----------
+        mdp : Environment object
+            MDP to learn
+        n_h : int
+            Height of the grid
+        n_w : int
+            Width of the grid
+        """
+
+        state = (self.random_stream.integers(n_h), self.random_stream.integers(n_w))
+
+        while mdp.is_wall(state):
+            state = (self.random_stream.integers(n_h), self.random_stream.integers(n_w))
+
+        return state
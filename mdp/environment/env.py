@@ -1,4 +1,5 @@
 import random
+import numpy as np
 
 
 class Environment():
@@ -19,13 +20,41 @@ class Environment():
         Width of the grid
     grid_height : int
          Height of the grid
+    num_states : int
+        Number of states in the grid
+    walls : 1-D Array
+        Flat mask of the wall states
+    reward_array : 1-D Array
+        Flat rewards for each state
+    transition_states : 3-D Array
+        Successor state indices for each state-action pair, shape (num_states, num_actions, 3)
+    transition_probabilities : 3-D Array
+        Probabilities of the successor states, same shape as transition_states
+    transition_cumulative : 3-D Array
+        Cumulative probabilities of the successor states used for sampling, same shape as transition_states
+    move_mask : 3-D Array
+        Whether the agent can move in each action direction from a state, shape (num_actions, grid_height, grid_width)
+    slip_weights : 2-D Array
+        Probability of moving in direction d when taking action a, shape (num_actions, num_actions)
+    predecessors : 2-D Array
+        Flat indices of the non-wall states that can reach each state in one step, shape (num_states, 5), padded with -1
 
     Methods
     ----------
     receive_reward(state): Returns the reward for the state
+    set_reward(state, reward): Changes the reward for the state
+    set_cell(state, cell, reward): Changes a cell of the grid world and recompiles the affected transitions
     get_actions(): Returns the list of all actions
+    compile_transitions(indices): Compiles the transition model into flat arrays
+    compile_moves(): Compiles the move mask and slip weights of the grid
+    compile_predecessors(indices): Compiles the reverse transition index
     transition_model(state, action): Returns the transition model P(s'|s,a)
     is_wall(state): Checks whether the state is wall
+    step(state, action): Samples the next state and reward of taking the action in the state
+    step_index(state_idx, action_idx): Samples the next state and reward by flat state and action indices
+    step_indices(state_indices, action_indices): Samples the next states and rewards of many agents at once
+    state_to_index(state): Returns the flat index of the state
+    index_to_state(index): Returns the state of the flat index
     """
 
     def __init__(self, grid_world, actions, rewards, grid_width, grid_height):
@@ -52,8 +81,31 @@ class Environment():
         self.grid_height = grid_height
         self.actions = actions
         self.num_actions = len(actions)
-        self.rewards = rewards
-        self.grid_world = grid_world
+
+        # set_reward and set_cell edit these in place, copy them so the caller's config is left untouched
+        self.rewards = [list(row) for row in rewards]
+        self.grid_world = [list(row) for row in grid_world]
+
+        self.action_index = {action: idx for idx, action in enumerate(actions)}
+        self.num_states = grid_height * grid_width
+
+        # Flat state information, state (row, column) is stored at index row * grid_width + column
+        self.walls = np.array([[cell == 'W' for cell in row] for row in grid_world], dtype=bool).reshape(-1)
+        self.reward_array = np.array(rewards, dtype=np.float64).reshape(-1)
+
+        # Every state-action pair has at most 3 successors, so the transition model is stored
+        # as fixed width rows: successor indices and their probabilities
+        self.transition_states = np.zeros((self.num_states, self.num_actions, 3), dtype=np.intp)
+        self.transition_probabilities = np.zeros((self.num_states, self.num_actions, 3), dtype=np.float64)
+        self.transition_cumulative = np.zeros((self.num_states, self.num_actions, 3), dtype=np.float64)
+        self.compile_transitions()
+
+        self.move_mask = np.zeros((self.num_actions, grid_height, grid_width), dtype=bool)
+        self.slip_weights = np.zeros((self.num_actions, self.num_actions), dtype=np.float64)
+        self.compile_moves()
+
+        self.predecessors = np.full((self.num_states, 5), -1, dtype=np.intp)
+        self.compile_predecessors()
 
 
     def receive_reward(self, state):
@@ -68,6 +120,78 @@ class Environment():
         return self.rewards[state[0]][state[1]]
 
 
+    def set_reward(self, state, reward):
+        """
+        Changes the reward for the state
+
+        Parameters
+        ----------
+        state : Tuple
+            State to change the reward of
+        reward : double
+            New reward of the state
+        """
+        self.rewards[state[0]][state[1]] = reward
+        self.reward_array[self.state_to_index(state)] = reward
+
+
+    def set_cell(self, state, cell, reward=None):
+        """
+        Changes a cell of the grid world, for example adding or removing a wall 'W',
+        and recompiles only the transitions, move mask and predecessors that depend on it
+
+        Parameters
+        ----------
+        state : Tuple
+            State (row, column) of the cell
+        cell : str
+            New content of the cell
+        reward : double, optional
+            New reward of the cell (default is None, 0 for walls and the current reward otherwise)
+
+        Returns
+        ----------
+        List of states whose transitions changed
+        """
+
+        if reward is None:
+            reward = 0 if cell == 'W' else self.rewards[state[0]][state[1]]
+
+        self.grid_world[state[0]][state[1]] = cell
+        self.set_reward(state, reward)
+
+        state_idx = self.state_to_index(state)
+        is_wall = cell == 'W'
+
+        if self.walls[state_idx] == is_wall:
+            return [state]
+
+        self.walls[state_idx] = is_wall
+
+        # The cell and its neighbours, moves into the cell are blocked or unblocked
+        changed = [state]
+        for action_idx, action in enumerate(self.actions):
+            neighbour = (state[0] - action[0], state[1] - action[1])
+
+            if 0 <= neighbour[0] < self.grid_height and 0 <= neighbour[1] < self.grid_width:
+                self.move_mask[action_idx, neighbour[0], neighbour[1]] = not is_wall
+                changed.append(neighbour)
+
+        self.compile_transitions([self.state_to_index(changed_state) for changed_state in changed])
+
+        # Predecessors depend on the transitions of the states up to one cell away
+        nearby = set()
+        for changed_state in changed:
+            for offset in [(0, 0), (-1, 0), (1, 0), (0, 1), (0, -1)]:
+                row, col = changed_state[0] + offset[0], changed_state[1] + offset[1]
+                if 0 <= row < self.grid_height and 0 <= col < self.grid_width:
+                    nearby.add(self.state_to_index((row, col)))
+
+        self.compile_predecessors(sorted(nearby))
+
+        return changed
+
+
     def get_actions(self):
         """
         Returns list of all actions
@@ -75,6 +199,156 @@ class Environment():
         return self.actions
 
 
+    def state_to_index(self, state):
+        """
+        Returns the flat index of the state
+
+        Parameters
+        ----------
+        state : Tuple
+            State as (row, column)
+        """
+        return state[0] * self.grid_width + state[1]
+
+
+    def index_to_state(self, index):
+        """
+        Returns the state as (row, column) for the flat index
+
+        Parameters
+        ----------
+        index : int
+            Flat index of the state
+        """
+        return (int(index) // self.grid_width, int(index) % self.grid_width)
+
+
+    def compile_transitions(self, indices=None):
+
+        """
+        Compiles the transition model P(s'| s, a) into transition_states, transition_probabilities
+        and the sampling table transition_cumulative
+
+        Parameters
+        ----------
+        indices : 1-D Array, optional
+            Flat indices of the states to compile (default is all states)
+        """
+
+        if indices is None:
+            indices = np.arange(self.num_states)
+
+        indices = np.asarray(indices, dtype=np.intp)
+        rows = indices // self.grid_width
+        cols = indices % self.grid_width
+
+        # Probability for going in the same direction is 0.8, probability for going in each perpendicular direction is 0.1
+        probability = [0.8, 0.1, 0.1]
+
+        for action_idx, action in enumerate(self.actions):
+
+            # Same directions as in transition_model
+            possible_directions = [action, (action[1], action[0]), (-action[1], -action[0])]
+
+            for idx, direction in enumerate(possible_directions):
+
+                next_rows = rows + direction[0]
+                next_cols = cols + direction[1]
+
+                # Stay in the same place when moving outside the grid or into a wall
+                inside = (0 <= next_rows) & (next_rows < self.grid_height) & (0 <= next_cols) & (next_cols < self.grid_width)
+                next_states = np.where(inside, next_rows * self.grid_width + next_cols, indices)
+                next_states = np.where(self.walls[next_states], indices, next_states)
+
+                self.transition_states[indices, action_idx, idx] = next_states
+                self.transition_probabilities[indices, action_idx, idx] = probability[idx]
+
+        # Merge successors that appear more than once into their first occurrence
+        states = self.transition_states[indices]
+        probabilities = self.transition_probabilities[indices]
+
+        for idx in range(1, 3):
+            for first in range(idx):
+                duplicate = (states[:, :, idx] == states[:, :, first]) & (probabilities[:, :, first] > 0) & (probabilities[:, :, idx] > 0)
+                probabilities[:, :, first] += np.where(duplicate, probabilities[:, :, idx], 0)
+                probabilities[:, :, idx] = np.where(duplicate, 0, probabilities[:, :, idx])
+
+        self.transition_probabilities[indices] = probabilities
+
+        # Sampling table, the last entry is exactly 1 so every uniform sample in [0, 1) finds a successor
+        cumulative = np.cumsum(probabilities, axis=2)
+        cumulative[:, :, -1] = 1
+        self.transition_cumulative[indices] = cumulative
+
+
+    def compile_moves(self):
+
+        """
+        Compiles the grid form of the transition model used by matrix-free solvers.
+        move_mask[d] is False where moving in direction d would leave the grid or walk into a wall,
+        slip_weights[a, d] is the probability of moving in direction d when taking action a
+        """
+
+        walls = self.walls.reshape(self.grid_height, self.grid_width)
+
+        # Probability for going in the same direction is 0.8, probability for going in each perpendicular direction is 0.1
+        probability = [0.8, 0.1, 0.1]
+
+        self.slip_weights[:] = 0
+
+        for action_idx, action in enumerate(self.actions):
+
+            # Cells from which the neighbour in this direction is inside the grid and not a wall
+            mask = np.zeros((self.grid_height, self.grid_width), dtype=bool)
+            rows = slice(max(0, -action[0]), self.grid_height - max(0, action[0]))
+            cols = slice(max(0, -action[1]), self.grid_width - max(0, action[1]))
+            next_rows = slice(max(0, action[0]), self.grid_height - max(0, -action[0]))
+            next_cols = slice(max(0, action[1]), self.grid_width - max(0, -action[1]))
+            mask[rows, cols] = ~walls[next_rows, next_cols]
+            self.move_mask[action_idx] = mask
+
+            possible_directions = [action, (action[1], action[0]), (-action[1], -action[0])]
+
+            for idx, direction in enumerate(possible_directions):
+                self.slip_weights[action_idx, self.action_index[direction]] += probability[idx]
+
+
+    def compile_predecessors(self, indices=None):
+
+        """
+        Compiles the reverse transition index. The agent moves at most one cell per step,
+        so the predecessors of a state are found among the state itself and its 4 neighbours
+
+        Parameters
+        ----------
+        indices : 1-D Array, optional
+            Flat indices of the states to compile (default is all states)
+        """
+
+        if indices is None:
+            indices = np.arange(self.num_states)
+
+        indices = np.asarray(indices, dtype=np.intp)
+        rows = indices // self.grid_width
+        cols = indices % self.grid_width
+
+        offsets = [(0, 0), (-1, 0), (1, 0), (0, 1), (0, -1)]
+
+        for idx, offset in enumerate(offsets):
+
+            candidate_rows = rows + offset[0]
+            candidate_cols = cols + offset[1]
+
+            inside = (0 <= candidate_rows) & (candidate_rows < self.grid_height) & (0 <= candidate_cols) & (candidate_cols < self.grid_width)
+            candidates = np.where(inside, candidate_rows * self.grid_width + candidate_cols, indices)
+
+            # The candidate is a predecessor if some action moves it into the state with nonzero probability
+            reaches = (self.transition_states[candidates] == indices[:, None, None]) & (self.transition_probabilities[candidates] > 0)
+            is_predecessor = inside & ~self.walls[candidates] & reaches.any(axis=(1, 2))
+
+            self.predecessors[indices, idx] = np.where(is_predecessor, candidates, -1)
+
+
     def transition_model(self, state, action):
 
         """
@@ -111,32 +385,16 @@ class Environment():
         EAST  : (0, 1), (1, 0), (-1, 0)  --> EAST, SOUTH, NORTH
         WEST  : (0, -1), (-1, 0), (1, 0) --> WEST, NORTH, SOUTH
         """
-        possible_directions = [action, (action[1], action[0]), (-action[1], -action[0])]
+        state_idx = self.state_to_index(state)
+        action_idx = self.action_index[action]
 
-        # Probability for going in the same direction is 0.8, probability for going in each perpendicular direction is 0.1
-        probability = [0.8, 0.1, 0.1]
-
-        # Loop through all possible directions the agent can go to by taking the action
-        for idx, direction in enumerate(possible_directions):
-
-            # Calculate next state
-            next_state = (state[0] + direction[0], state[1] + direction[1])
+        # Read the precompiled successors of the state-action pair
+        next_states = self.transition_states[state_idx, action_idx]
+        probabilities = self.transition_probabilities[state_idx, action_idx]
 
-            # Check if next state is within the boundaries of the grid
-            if 0 <= next_state[0] < self.grid_width and 0 <= next_state[1] < self.grid_height:
-
-                # Check if next state is a wall
-                if self.grid_world[next_state[0]][next_state[1]] == 'W':
-                    next_state = state
-            else:
-                next_state = state
-            
-            # Check if next state is already in the transition model
-            # If true then add the probabilities
-            if next_state in model:
-                model[next_state] += probability[idx]
-            else:
-                model[next_state] = probability[idx]
+        for next_state, probability in zip(next_states, probabilities):
+            if probability > 0:
+                model[self.index_to_state(next_state)] = float(probability)
 
         return model
 
@@ -148,36 +406,79 @@ class Environment():
 
         return self.grid_world[state[0]][state[1]] == 'W'
 
-    def step(self, state, action):
+    def step(self, state, action, rand_num=None):
 
         """
-        Return next state and reward when taking action 'action' in state 'state'
+        Return next state and reward when taking action 'action' in state 'state',
+        'rand_num' is a uniform sample in [0, 1) that picks the outcome (default draws one)
         """
 
         if action is None:
             return None, None
 
-        model = self.transition_model(state=state, action=action)
+        next_idx, reward = self.step_index(self.state_to_index(state), self.action_index[action], rand_num)
 
-        rand_num = random.uniform(0, 1)
-        
-        cont_prob = {}
-        last_prob = 0
+        if next_idx is None:
+            return None, None
+
+        return self.index_to_state(next_idx), reward
 
-        for key, value in model.items():
+    def step_index(self, state_idx, action_idx, rand_num=None):
+
+        """
+        Return the flat index of the next state and the reward when taking
+        the action with index 'action_idx' in the state with flat index 'state_idx',
+        'rand_num' is a uniform sample in [0, 1) that picks the outcome (default draws one)
+        """
+
+        if rand_num is None:
+            rand_num = random.uniform(0, 1)
+
+        # First successor whose cumulative probability exceeds the sample, successors with probability 0 are never picked
+        cumulative = self.transition_cumulative[state_idx, action_idx].tolist()
+
+        if rand_num < cumulative[0]:
+            successor = 0
+        elif rand_num < cumulative[1]:
+            successor = 1
+        else:
+            successor = 2
+
+        next_idx = int(self.transition_states[state_idx, action_idx, successor])
+
+        return next_idx, float(self.reward_array[next_idx])
+
+    def step_indices(self, state_indices, action_indices, rand_nums=None):
+
+        """
+        Samples the next states and rewards of many agents at once, agent i takes
+        the action with index action_indices[i] in the state with flat index state_indices[i]
+
+        Parameters
+        ----------
+        state_indices : 1-D Array
+            Flat indices of the current states
+        action_indices : 1-D Array
+            Indices of the actions taken
+        rand_nums : 1-D Array, optional
+            Uniform samples in [0, 1) that pick the outcomes (default draws them)
+
+        Returns
+        ----------
+        flat indices of the next states, rewards
+        """
 
-            cont_prob[key] = last_prob + value
-            last_prob += value
+        if rand_nums is None:
+            rand_nums = np.random.random(len(state_indices))
 
-        # The if condition is always met once in every loop
-        for key, value in cont_prob.items():
-            if rand_num <= value:
-                next_state = key
-                reward = self.receive_reward(next_state)
+        # Number of cumulative probabilities not above the sample is the index of the picked successor,
+        # successors with probability 0 are never picked
+        cumulative = self.transition_cumulative[state_indices, action_indices]
+        successors = (cumulative <= rand_nums[:, None]).sum(axis=1)
 
-                return next_state, reward
+        next_indices = self.transition_states[state_indices, action_indices, successors]
 
-        return None, None
+        return next_indices, self.reward_array[next_indices]
 
     def action_map(self, action_id):
         actions = {
@@ -0,0 +1,140 @@
+import numpy as np
+
+
+class EarlyStopping():
+
+    """
+    Early Stopping Class
+    Checks the Q-table of a learner every check_interval episodes and tells it to stop once one of
+    the enabled criteria has held for patience checks in a row. A check copies the Q-table once,
+    so its cost is spread over check_interval episodes. Single, lockstep and asynchronous runs are all
+    checked every check_interval episodes. With a constant step size, actions with nearly tied Q-values
+    keep swapping, so policy_stable may hold early or never, whatever the mode
+
+    Attributes
+    ----------
+    check_interval : int
+        Number of episodes between two checks
+    patience : int
+        Number of checks in a row a criterion must hold
+    policy_stable : bool
+        Stop once the greedy policy no longer changes between checks
+    q_tolerance : double
+        Stop once no Q-value moves by more than q_tolerance between checks
+    reference_policy : 1-D Array
+        Flat reference policy, for example from ValueIteration
+    min_agreement : double
+        Stop once the greedy policy matches the reference policy on this fraction of the open states
+    reference_values : 1-D Array
+        Flat reference utilities, for example from ValueIteration
+    value_tolerance : double
+        Stop once max_a Q(s, a) is within value_tolerance of the reference utility of every open state
+    open_states : 1-D Array
+        Flat indices of the states that are not walls
+    previous : 2-D Array
+        Q-table at the last check
+    streaks : dictionary
+        Number of checks in a row each criterion has held
+
+    Methods
+    ----------
+    reset(q_values, walls): Starts a new run from the given Q-table
+    check(q_values): Returns the stop reason, or None to keep learning
+    """
+
+    def __init__(self, check_interval=1000, patience=3, policy_stable=False, q_tolerance=None, reference=None, min_agreement=1.0, value_tolerance=None):
+        """
+        Parameters
+        ----------
+        check_interval : int, optional
+            Number of episodes between two checks (default is 1000)
+        patience : int, optional
+            Number of checks in a row a criterion must hold (default is 3)
+        policy_stable : bool, optional
+            Stop once the greedy policy no longer changes between checks (default is False)
+        q_tolerance : double, optional
+            Stop once no Q-value moves by more than q_tolerance between checks (default is None, disabled)
+        reference : dictionary, optional
+            Results of a ValueIteration or PolicyIteration solve, enables the reference policy
+            criterion and, with a value_tolerance, the reference value criterion (default is None, disabled)
+        min_agreement : double, optional
+            Fraction of the open states where the greedy action must match the reference policy (default is 1.0)
+        value_tolerance : double, optional
+            Largest gap between max_a Q(s, a) and the reference utility (default is None, disabled)
+        """
+
+        if check_interval < 1:
+            raise ValueError(f"check_interval must be at least 1: {check_interval}")
+
+        self.check_interval = check_interval
+        self.patience = patience
+        self.policy_stable = policy_stable
+        self.q_tolerance = q_tolerance
+        self.reference_policy = None if reference is None else np.asarray(reference['policy']).reshape(-1)
+        self.min_agreement = min_agreement
+        self.reference_values = None if reference is None or value_tolerance is None else np.asarray(reference['utilities'], dtype=np.float64).reshape(-1)
+        self.value_tolerance = value_tolerance
+
+        self.open_states = None
+        self.previous = None
+        self.streaks = {}
+
+    def reset(self, q_values, walls):
+        """
+        Starts a new run from the given Q-table
+
+        Parameters
+        ----------
+        q_values : 2-D Array
+            Flat Q-table of shape (num_states, num_actions)
+        walls : 1-D Array
+            Flat wall mask of the Environment
+        """
+
+        self.open_states = np.flatnonzero(~np.asarray(walls).reshape(-1))
+        self.previous = q_values[self.open_states]
+        self.streaks = {}
+
+    def check(self, q_values):
+        """
+        Compares the Q-table with the last check and the reference
+
+        Parameters
+        ----------
+        q_values : 2-D Array
+            Flat Q-table of shape (num_states, num_actions)
+
+        Returns
+        ----------
+        'policy_stable', 'q_converged', 'reference_policy' or 'reference_values' once the criterion
+        has held for patience checks in a row, otherwise None
+        """
+
+        current = q_values[self.open_states]
+        policy = current.argmax(axis=1)
+
+        criteria = {}
+
+        if self.policy_stable:
+            criteria['policy_stable'] = np.array_equal(policy, self.previous.argmax(axis=1))
+
+        if self.q_tolerance is not None:
+            criteria['q_converged'] = np.abs(current - self.previous).max() <= self.q_tolerance
+
+        if self.reference_policy is not None:
+            criteria['reference_policy'] = (policy == self.reference_policy[self.open_states]).mean() >= self.min_agreement
+
+        if self.reference_values is not None:
+            criteria['reference_values'] = np.abs(current.max(axis=1) - self.reference_values[self.open_states]).max() <= self.value_tolerance
+
+        self.previous = current
+
+        for reason, holds in criteria.items():
+
+            # A criterion that fails starts its streak over
+            self.streaks[reason] = self.streaks.get(reason, 0) + 1 if holds else 0
+
+            if self.streaks[reason] >= self.patience:
+                return reason
+
+        return None
@@ -0,0 +1,110 @@
+import numpy as np
+
+
+class RandomStream():
+
+    """
+    Random Stream Class
+    Draws random numbers from a numpy Generator in large pre-generated blocks, so a learner
+    pays the cost of the Generator call once per block instead of once per step
+
+    Attributes
+    ----------
+    generator : numpy Generator
+        Source of the random numbers
+    block_size : int
+        Number of uniform samples generated at a time
+    uniforms : List
+        Current block of uniform samples in [0, 1)
+    position : int
+        Index of the next unused sample of the block
+
+    Methods
+    ----------
+    random(): Returns a uniform sample in [0, 1)
+    integers(high): Returns a random integer in [0, high)
+    random_array(size): Returns an array of uniform samples in [0, 1)
+    integers_array(high, size): Returns an array of random integers in [0, high)
+    refill(): Generates the next block of uniform samples
+    """
+
+    def __init__(self, seed=None, block_size=65536):
+        """
+        Parameters
+        ----------
+        seed : int, SeedSequence or Generator, optional
+            Seed of the Generator, a Generator is used as is (default is None, fresh entropy)
+        block_size : int, optional
+            Number of uniform samples generated at a time (default is 65536)
+        """
+
+        self.generator = np.random.default_rng(seed)
+        self.block_size = block_size
+
+        self.uniforms = []
+        self.position = 0
+
+
+    def random(self):
+        """
+        Returns a uniform sample in [0, 1) from the current block
+        """
+
+        if self.position == len(self.uniforms):
+            self.refill()
+
+        sample = self.uniforms[self.position]
+        self.position += 1
+
+        return sample
+
+
+    def integers(self, high):
+        """
+        Returns a random integer in [0, high)
+
+        Parameters
+        ----------
+        high : int
+            Upper bound, exclusive
+        """
+
+        return int(self.random() * high)
+
+
+    def random_array(self, size):
+        """
+        Returns an array of uniform samples in [0, 1), drawn from the Generator directly
+
+        Parameters
+        ----------
+        size : int
+            Number of samples
+        """
+
+        return self.generator.random(size)
+
+
+    def integers_array(self, high, size):
+        """
+        Returns an array of random integers in [0, high), scaled from uniform samples
+        of the Generator, which is much cheaper than Generator.integers for small arrays
+
+        Parameters
+        ----------
+        high : int or N-D Array
+            Upper bound, exclusive
+        size : int
+            Number of samples
+        """
+
+        return (self.generator.random(size) * high).astype(np.intp)
+
+
+    def refill(self):
+        """
+        Generates the next block of uniform samples, Python floats are the fastest to read one at a time
+        """
+
+        self.uniforms = self.generator.random(self.block_size).tolist()
+        self.position = 0
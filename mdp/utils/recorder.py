@@ -0,0 +1,287 @@
+import struct
+import numpy as np
+
+
+class HistoryRecorder():
+
+    """
+    History Recorder Class
+    Records the utilities of every state during a solve into a preallocated array
+
+    Attributes
+    ----------
+    max_iterations : int
+        Number of recorded sweeps to preallocate space for
+    stride : int
+        Record every stride-th sweep
+    history : 3-D Array
+        Recorded utilities, shape (max_iterations, grid_height, grid_width)
+    count : int
+        Number of recorded sweeps
+    skipped : 2-D Array
+        Utilities of the last sweep when stride skipped it, None once it is recorded
+
+    Methods
+    ----------
+    start(utilities): Resets the history and records the initial utilities
+    record(utilities): Records the utilities after a sweep
+    finish(): Records the last sweep if stride skipped it, so the history ends at the converged utilities
+    get_history(): Returns the recorded utilities
+    to_dict(): Returns the history as a dictionary of per-state lists
+    """
+
+    def __init__(self, max_iterations=1000, stride=1):
+        """
+        Parameters
+        ----------
+        max_iterations : int, optional
+            Number of recorded sweeps to preallocate space for, the array grows if more are recorded (default is 1000)
+        stride : int, optional
+            Record every stride-th sweep (default is 1)
+        """
+
+        self.max_iterations = max_iterations
+        self.stride = stride
+
+        self.history = None
+        self.count = 0
+        self.sweeps = 0
+        self.skipped = None
+
+
+    def start(self, utilities):
+        """
+        Resets the history and records the initial utilities
+
+        Parameters
+        ----------
+        utilities : 2-D Array
+            Initial utilities of the solve
+        """
+
+        self.history = np.zeros((self.max_iterations,) + utilities.shape, dtype=utilities.dtype)
+        self.count = 0
+        self.sweeps = 0
+        self.skipped = None
+
+        self.append(utilities)
+
+
+    def record(self, utilities):
+        """
+        Records the utilities after a sweep
+
+        Parameters
+        ----------
+        utilities : 2-D Array
+            Utilities after the sweep
+        """
+
+        self.sweeps += 1
+
+        if self.sweeps % self.stride == 0:
+            self.append(utilities)
+            self.skipped = None
+        else:
+            # Solvers may keep updating the array in place, keep a copy in case this is the last sweep
+            self.skipped = np.array(utilities, copy=True)
+
+
+    def append(self, utilities):
+        """
+        Stores the utilities in the next row of the history, doubling its size when full
+
+        Parameters
+        ----------
+        utilities : 2-D Array
+            Utilities to store
+        """
+
+        if self.count == self.history.shape[0]:
+            self.history = np.concatenate([self.history, np.zeros_like(self.history)])
+
+        self.history[self.count] = utilities
+        self.count += 1
+
+
+    def finish(self):
+        """
+        Records the last sweep if stride skipped it, so the history ends at the converged utilities
+        """
+
+        if self.skipped is not None:
+            self.append(self.skipped)
+            self.skipped = None
+
+
+    def get_history(self):
+        """
+        Returns the recorded utilities, shape (count, grid_height, grid_width)
+        """
+
+        if self.history is None:
+            return np.zeros((0, 0, 0))
+
+        return self.history[:self.count]
+
+
+    def to_dict(self):
+        """
+        Returns the history as a dictionary of per-state lists keyed by '(column, row)'
+        """
+
+        history = self.get_history()
+        data = {}
+
+        for i in range(history.shape[1]):
+            for j in range(history.shape[2]):
+                data[f'{(j, i)}'] = history[:, i, j].tolist()
+
+        return data
+
+
+class MemmapRecorder(HistoryRecorder):
+
+    """
+    Memory-Mapped Recorder Class
+    Streams the utilities of every recorded sweep to a .npy file on disk,
+    so memory stays flat regardless of the number of sweeps.
+    The file can be opened lazily with np.load(path, mmap_mode='r')
+
+    Attributes
+    ----------
+    path : str
+        Path of the .npy file
+    stride : int
+        Record every stride-th sweep
+    flush_every : int
+        Number of recorded sweeps between header updates
+    count : int
+        Number of recorded sweeps
+
+    Methods
+    ----------
+    start(utilities): Creates the file and records the initial utilities
+    record(utilities): Appends the utilities after a sweep
+    flush(): Writes the current sweep count to the header and flushes the file
+    finish(): Records the last sweep if stride skipped it, then flushes and closes the file
+    get_history(): Returns the recorded utilities as a read-only memory map
+    to_dict(): Returns the history as a dictionary of per-state lists
+    """
+
+    # Fixed header size, the shape in the header is rewritten in place as sweeps are appended
+    HEADER_SIZE = 128
+
+    def __init__(self, path, stride=1, flush_every=100):
+        """
+        Parameters
+        ----------
+        path : str
+            Path of the .npy file
+        stride : int, optional
+            Record every stride-th sweep (default is 1)
+        flush_every : int, optional
+            Number of recorded sweeps between header updates (default is 100)
+        """
+
+        super().__init__(stride=stride)
+
+        self.path = path
+        self.flush_every = flush_every
+
+        self.file = None
+        self.shape = None
+        self.dtype = None
+
+
+    def start(self, utilities):
+        """
+        Creates the file and records the initial utilities
+
+        Parameters
+        ----------
+        utilities : 2-D Array
+            Initial utilities of the solve
+        """
+
+        if self.file is not None:
+            self.file.close()
+
+        self.shape = utilities.shape
+        self.dtype = utilities.dtype
+        self.count = 0
+        self.sweeps = 0
+        self.skipped = None
+
+        self.file = open(self.path, 'wb+')
+        self.write_header()
+
+        self.append(utilities)
+
+
+    def append(self, utilities):
+        """
+        Appends the utilities to the end of the file
+
+        Parameters
+        ----------
+        utilities : 2-D Array
+            Utilities to store
+        """
+
+        self.file.write(np.ascontiguousarray(utilities, dtype=self.dtype).tobytes())
+        self.count += 1
+
+        if self.count % self.flush_every == 0:
+            self.flush()
+
+
+    def write_header(self):
+        """
+        Writes the .npy header for the current number of sweeps, padded to HEADER_SIZE bytes
+        """
+
+        header = "{'descr': %r, 'fortran_order': False, 'shape': %r, }" % (
+            np.lib.format.dtype_to_descr(self.dtype), (self.count,) + tuple(self.shape)
+        )
+
+        # Magic string (6 bytes), version (2 bytes) and header length (2 bytes) precede the header
+        header = header.ljust(self.HEADER_SIZE - 10 - 1) + '\n'
+
+        self.file.seek(0)
+        self.file.write(np.lib.format.magic(1, 0) + struct.pack('<H', len(header)) + header.encode('latin1'))
+        self.file.seek(0, 2)
+
+
+    def flush(self):
+        """
+        Writes the current sweep count to the header and flushes the file
+        """
+
+        self.write_header()
+        self.file.flush()
+
+
+    def finish(self):
+        """
+        Records the last sweep if stride skipped it, then flushes and closes the file
+        """
+
+        if self.file is None:
+            return
+
+        super().finish()
+        self.flush()
+        self.file.close()
+        self.file = None
+
+
+    def get_history(self):
+        """
+        Returns the recorded utilities as a read-only memory map, shape (count, grid_height, grid_width)
+        """
+
+        if self.file is not None:
+            self.flush()
+
+        return np.load(self.path, mmap_mode='r')
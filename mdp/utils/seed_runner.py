@@ -0,0 +1,174 @@
+"""
+Multi-seed experiment runner
+
+Runs independent seeds of a learner in a pool of worker processes. The Environment is sent
+to every worker once through the pool initializer, so a task only carries the learner class,
+its parameters and the seed. Every seed gets its own SeedSequence spawned from one root seed.
+"""
+
+
+import os
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+from scipy import stats
+
+
+# Environment of the worker process, set by init_worker
+worker_state = {}
+
+
+def init_worker(mdp):
+    """
+    Keeps the Environment in the worker process for all of its tasks
+
+    Parameters
+    ----------
+    mdp : Environment object
+        MDP shared by every seed
+    """
+
+    worker_state['mdp'] = mdp
+
+
+def run_seed(task):
+    """
+    Trains one learner on the worker's Environment
+
+    Parameters
+    ----------
+    task : Tuple
+        (learner class, constructor parameters, seed)
+
+    Returns
+    ----------
+    Q-table of shape (n_h, n_w, n_actions)
+    """
+
+    algorithm, parameters, seed = task
+
+    learner = algorithm(**parameters, seed=seed)
+    results = learner.solve(worker_state['mdp'])
+
+    # Learners with early stopping return the Q-table in a dictionary
+    if isinstance(results, dict):
+        results = results['q_table']
+
+    return np.asarray(results)
+
+
+class SeedRunner():
+
+    """
+    Seed Runner Class
+    Runs many seeds of a learner in parallel and aggregates the results
+
+    Attributes
+    ----------
+    algorithm : class
+        Learner class, constructed as algorithm(**parameters, seed=seed), whose solve(mdp) returns a Q-table
+    parameters : dictionary
+        Constructor parameters of the learner
+    num_seeds : int
+        Number of independent seeds
+    seed : int
+        Root seed the seeds are spawned from
+    num_workers : int
+        Number of worker processes
+    confidence : double
+        Confidence level of the intervals
+
+    Methods
+    ----------
+    run(mdp, reference): Trains every seed and aggregates the results
+    confidence_interval(samples): Returns the mean and confidence interval half-width over the seeds
+    """
+
+    def __init__(self, algorithm, parameters, num_seeds=8, seed=None, num_workers=None, confidence=0.95):
+        """
+        Parameters
+        ----------
+        algorithm : class
+            Learner class, for example QLearning, it must take a seed parameter
+        parameters : dictionary
+            Constructor parameters of the learner, without the seed
+        num_seeds : int, optional
+            Number of independent seeds (default is 8)
+        seed : int, optional
+            Root seed the seeds are spawned from (default is None, fresh entropy)
+        num_workers : int, optional
+            Number of worker processes (default is None, the number of CPUs)
+        confidence : double, optional
+            Confidence level of the intervals (default is 0.95)
+        """
+
+        self.algorithm = algorithm
+        self.parameters = parameters
+        self.num_seeds = num_seeds
+        self.seed = seed
+        self.num_workers = num_workers
+        self.confidence = confidence
+
+    def run(self, mdp, reference=None):
+        """
+        Trains every seed and aggregates the greedy values max_a Q(s, a) and,
+        given a reference solution, the agreement of the greedy policies with it
+
+        Parameters
+        ----------
+        mdp : Environment object
+            MDP to learn
+
+        reference : dictionary, optional
+            Results of a ValueIteration or PolicyIteration solve (default is None, no comparison)
+
+        Returns
+        ----------
+        Q-tables of shape (num_seeds, n_h, n_w, n_actions), per-state mean and confidence interval
+        half-width of the values, and with a reference the fraction of non-wall states where each
+        seed's greedy action matches the reference policy with its mean and half-width, as a dictionary
+        """
+
+        seeds = np.random.SeedSequence(self.seed).spawn(self.num_seeds)
+        tasks = [(self.algorithm, self.parameters, seed) for seed in seeds]
+
+        num_workers = min(self.num_workers or os.cpu_count(), self.num_seeds)
+
+        with ProcessPoolExecutor(num_workers, initializer=init_worker, initargs=(mdp,)) as executor:
+            q_tables = np.stack(list(executor.map(run_seed, tasks)))
+
+        values = q_tables.max(axis=3)
+        values_mean, values_ci = self.confidence_interval(values)
+
+        results = {"q_tables": q_tables, "values_mean": values_mean, "values_ci": values_ci}
+
+        if reference is not None:
+            walls = mdp.walls.reshape(mdp.grid_height, mdp.grid_width)
+            policies = q_tables.argmax(axis=3)
+
+            # Fraction of the non-wall states where the greedy action matches the reference
+            agreement = (policies == np.asarray(reference['policy']))[:, ~walls].mean(axis=1)
+            agreement_mean, agreement_ci = self.confidence_interval(agreement)
+
+            results.update({"agreement": agreement, "agreement_mean": agreement_mean, "agreement_ci": agreement_ci})
+
+        return results
+
+    def confidence_interval(self, samples):
+        """
+        Returns the mean over the seeds and the half-width of its Student t confidence interval
+
+        Parameters
+        ----------
+        samples : N-D Array
+            One sample per seed along the first axis
+        """
+
+        mean = samples.mean(axis=0)
+
+        if len(samples) < 2:
+            return mean, np.full_like(mean, np.nan)
+
+        standard_error = samples.std(axis=0, ddof=1) / np.sqrt(len(samples))
+
+        return mean, stats.t.ppf((1 + self.confidence) / 2, len(samples) - 1) * standard_error
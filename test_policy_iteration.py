@@ -1,6 +1,7 @@
 from mdp.algorithms.policy_iteration import PolicyIteration
 from mdp.environment.env import Environment
 from file_manager import FileManager
+from mdp.utils.recorder import HistoryRecorder
 import pygame
 
 # Change file name to custom_grid to use your own grid
@@ -29,7 +30,7 @@ ratio = 1
 mdp = Environment(grid, actions, rewards, gw, gh)
 
 # Initialize the algorithm
-policy_iteration = PolicyIteration(GAMMA, K)
+policy_iteration = PolicyIteration(GAMMA, K, recorder=HistoryRecorder())
 
 # Solve the MDP
 results = policy_iteration.solve(mdp)
@@ -58,7 +59,7 @@ if DISPLAY_GRID:
     WHITE = (200, 200, 200)
     GREY = (50, 50, 50)
 
-    directions = [[CONVERT_POLICY[cell] for cell in row] for row in policy]
+    directions = [[CONVERT_POLICY[mdp.actions[cell]] for cell in row] for row in policy]
     utilities = [["{:.3f}".format(cell) for cell in row] for row in values]
 
     colors = []
@@ -0,0 +1,70 @@
+from mdp.algorithms.rtdp import RTDP
+from mdp.environment.env import Environment
+from display_manager import DisplayManager
+import pygame
+
+# Change file name to custom_grid to use your own grid
+from env_config import grid, actions, rewards, gw, gh
+
+
+pygame.init()
+
+# Initialize Constants
+GAMMA = 0.99
+C = 0.1
+MAX_REWARD = 1.0
+EPSILON = C * MAX_REWARD
+START_STATES = [(5, 0)]
+CONVERT_POLICY = {(1,0): '↓', (-1, 0): '↑' , (0, 1): '→', (0, -1): '←'}
+DISPLAY_GRID = True
+
+UTILITY_FONT_SIZE = 15
+UTILITY_OFFSET = (4, 14)
+
+POLICY_FONT_SIZE = 30
+POLICY_OFFSET = (17, 5)
+
+ratio = 1
+
+# Initialize the MDP
+mdp = Environment(grid, actions, rewards, gw, gh)
+
+# Initialize the algorithm
+rtdp = RTDP(GAMMA)
+
+# Solve the MDP from the start states
+results = rtdp.solve(mdp, START_STATES, EPSILON)
+
+# Retrieve the results
+num_trials = results['iterations']
+values = results['utilities']
+policy = results['policy']
+visited = results['visited']
+
+# Print the results to the console
+print(f'Number of trials: {num_trials}\n')
+print(f'Converged: {results["converged"]}\n')
+print(f'Number of backups: {results["backups"]}\n')
+print(f'Number of visited states: {visited.sum()}\n')
+print('\n(Column, Row)')
+for i in range(values.shape[0]):
+    for j in range(values.shape[1]):
+        if visited[i][j]:
+            print(f"{j, i}: {values[i][j]}")
+
+# Display utility and policy plot of the visited states
+if DISPLAY_GRID:
+
+    directions = [[CONVERT_POLICY[mdp.actions[cell]] if visited[i][j] else '' for j, cell in enumerate(row)] for i, row in enumerate(policy)]
+    utilities = [["{:.3f}".format(cell) if visited[i][j] else '' for j, cell in enumerate(row)] for i, row in enumerate(values)]
+
+    policy_font = pygame.font.Font("assets/seguisym.ttf", int(POLICY_FONT_SIZE*ratio))
+    utility_font = pygame.font.Font("assets/seguisym.ttf", int(UTILITY_FONT_SIZE*ratio))
+
+    display_manager = DisplayManager(block_size=50, width=300, height=300)
+
+    # Display Policy
+    display_manager.display(array=directions, grid=grid, offset=POLICY_OFFSET, font=policy_font, title='RTDP')
+
+    # Display Utilities
+    display_manager.display(array=utilities, grid=grid, offset=UTILITY_OFFSET, font=utility_font, title='RTDP')
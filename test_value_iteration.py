@@ -1,6 +1,7 @@
 from mdp.algorithms.value_iteration import ValueIteration
 from mdp.environment.env import Environment
 from file_manager import FileManager
+from mdp.utils.recorder import HistoryRecorder
 import pygame
 
 # Change file name to custom_grid to use your own grid
@@ -17,6 +18,7 @@ EPSILON = C * MAX_REWARD
 PATH = 'analysis/'
 CONVERT_POLICY = {(1,0): '↓', (-1, 0): '↑' , (0, 1): '→', (0, -1): '←'}
 DISPLAY_GRID = True
+VECTORIZED = False
 
 UTILITY_FONT_SIZE = 15
 UTILITY_OFFSET = (4, 14)
@@ -30,7 +32,7 @@ ratio = 1
 mdp = Environment(grid, actions, rewards, gw, gh)
 
 # Initialize the algorithm
-value_iteration = ValueIteration(GAMMA)
+value_iteration = ValueIteration(GAMMA, vectorized=VECTORIZED, recorder=HistoryRecorder())
 
 # Solve the MDP
 results = value_iteration.solve(mdp, EPSILON)
@@ -59,7 +61,7 @@ if DISPLAY_GRID:
     WHITE = (200, 200, 200)
     GREY = (50, 50, 50)
 
-    directions = [[CONVERT_POLICY[cell] for cell in row] for row in policy]
+    directions = [[CONVERT_POLICY[mdp.actions[cell]] for cell in row] for row in policy]
     utilities = [["{:.3f}".format(cell) for cell in row] for row in values]
 
     colors = []